@@ -1,12 +1,19 @@
 import torch
 import torch.nn as nn
-from transformers import BertModel
+from transformers import BertConfig, BertModel
+from transformers.modeling_utils import no_init_weights
 import numpy as np
 from sklearn.preprocessing import StandardScaler
 class BERTWithExtraFeature(nn.Module):
-    def __init__(self, pretrained_model_name='bert-base-uncased', dropout_prob=0.2, num_trainable_layers=1):
+    def __init__(self, pretrained_model_name='bert-base-uncased', dropout_prob=0.2, num_trainable_layers=1, bert_config: BertConfig = None):
         super(BERTWithExtraFeature, self).__init__()
-        self.bert = BertModel.from_pretrained(pretrained_model_name)
+        if bert_config is not None:
+            # Architecture only: skips downloading (and randomly initializing) base weights
+            # that a full state_dict overwrites anyway
+            with no_init_weights():
+                self.bert = BertModel(bert_config)
+        else:
+            self.bert = BertModel.from_pretrained(pretrained_model_name)
 
         # Freeze all layers in the BERT model
         for param in self.bert.parameters():
@@ -34,7 +41,7 @@ class BERTWithExtraFeature(nn.Module):
         self.relu3 = nn.ReLU()
         self.output_layer = nn.Linear(64, 1)
 
-    def forward(self, input_ids, attention_mask, extra_number):
+    def forward(self, input_ids, attention_mask, extra_number, return_pooled=False):
         outputs = self.bert(input_ids=input_ids, attention_mask=attention_mask)
         pooled_output = outputs.pooler_output
 
@@ -55,55 +62,137 @@ class BERTWithExtraFeature(nn.Module):
         
         output = self.output_layer(x)
 
+        if return_pooled:
+            return output, pooled_output
         return output
-def preprocess_inputs_pt(question, answer, bert_tokenizer, scaler: StandardScaler, device, max_length=512):
-    extra_number = len(question.split()) + len(answer.split())
-    tokenize_output = tokenize_inputs_pt([question], [answer],  bert_tokenizer, max_length=512)
+class FrozenBERTScorer(nn.Module):
+    """
+    Inference-only form of a trained BERTWithExtraFeature.
+
+    The StandardScaler and the eval-mode BatchNorm on the word count are both affine,
+    so they are folded into the word-count column of fc0, and the head becomes one
+    nn.Sequential. forward() therefore takes the raw word count, with no sklearn or
+    BatchNorm step at request time, and returns (score, pooled_output). Build it
+    with export_frozen_scorer to get a frozen TorchScript artifact.
+    """
+    def __init__(self, model: BERTWithExtraFeature, scaler: StandardScaler):
+        super(FrozenBERTScorer, self).__init__()
+        self.bert = model.bert
+
+        # scaler: z = (x - mean) / scale, BatchNorm: y = (z - running_mean) / sqrt(running_var + eps) * weight + bias
+        mean = float(scaler.mean_[0]) if scaler.mean_ is not None else 0.0
+        scale = float(scaler.scale_[0]) if scaler.scale_ is not None else 1.0
+        bn = model.num_feature_norm
+        bn_scale = (bn.weight / torch.sqrt(bn.running_var + bn.eps)).item() if bn.affine else (1.0 / torch.sqrt(bn.running_var + bn.eps)).item()
+        bn_shift = (bn.bias.item() if bn.affine else 0.0) - bn.running_mean.item() * bn_scale
+        # so y = a * x + c
+        a = bn_scale / scale
+        c = bn_shift - mean * bn_scale / scale
+
+        fc0 = nn.Linear(model.fc0.in_features, model.fc0.out_features)
+        with torch.no_grad():
+            fc0.weight.copy_(model.fc0.weight)
+            fc0.bias.copy_(model.fc0.bias + model.fc0.weight[:, -1] * c)
+            fc0.weight[:, -1] *= a
+
+        self.head = nn.Sequential(
+            fc0, nn.ReLU(),
+            model.fc1, nn.ReLU(),
+            model.fc2, nn.ReLU(),
+            model.fc3, nn.ReLU(),
+            model.output_layer,
+        )
+
+    def forward(self, input_ids, attention_mask, word_count):
+        pooled_output = self.bert(input_ids=input_ids, attention_mask=attention_mask, return_dict=False)[1]
+        if word_count.dim() == 1:
+            word_count = word_count.unsqueeze(1)
+        return self.head(torch.cat((pooled_output, word_count), dim=1)), pooled_output
+def export_frozen_scorer(model: BERTWithExtraFeature, scaler: StandardScaler, path: str):
+    """
+    Trace FrozenBERTScorer with TorchScript, freeze it (weights become constants) and save it to `path`.
+    """
+    frozen = FrozenBERTScorer(model.eval(), scaler).eval()
+    # Example batch with padding in the second row so the attention-mask path is traced
+    input_ids = torch.ones((2, 16), dtype=torch.long)
+    attention_mask = torch.ones((2, 16), dtype=torch.long)
+    attention_mask[1, 8:] = 0
+    word_count = torch.tensor([[250.0], [120.0]])
+
+    with torch.no_grad():
+        traced = torch.jit.trace(frozen, (input_ids, attention_mask, word_count))
+        traced = torch.jit.freeze(traced)
+    torch.jit.save(traced, path)
+    return traced
+def preprocess_inputs_pt(question, answer, bert_tokenizer, scaler: StandardScaler, device, max_length=512, pad_to_multiple_of=None):
+    return preprocess_batch_inputs_pt([question], [answer], bert_tokenizer, scaler, device, max_length=max_length, pad_to_multiple_of=pad_to_multiple_of)
+def preprocess_batch_inputs_pt(questions, answers, bert_tokenizer, scaler: StandardScaler, device, max_length=512, pad_to_multiple_of=None):
+    """
+    Batched version of preprocess_inputs_pt: tokenizes every (question, answer) pair
+    and standardizes the word counts in a single scaler call.
+    """
+    extra_numbers = np.array(
+        [len(q.split()) + len(a.split()) for q, a in zip(questions, answers)],
+        dtype=np.float32
+    ).reshape(-1, 1)
+    tokenize_output = tokenize_inputs_pt(questions, answers, bert_tokenizer, max_length=max_length, pad_to_multiple_of=pad_to_multiple_of)
     input_ids = tokenize_output['input_ids'].to(device)
     attention_mask = tokenize_output['attention_mask'].to(device)
-    extra_number = torch.tensor([extra_number], dtype=torch.float32).to(device)
-    numerical_features_val_std = scaler.transform([extra_number])
+    # scaler=None passes raw word counts, for models that fold the scaler in (FrozenBERTScorer)
+    numerical_features_val_std = scaler.transform(extra_numbers) if scaler is not None else extra_numbers
     numerical_features_val_std = torch.tensor(numerical_features_val_std, dtype=torch.float32).to(device)
     return input_ids, attention_mask, numerical_features_val_std
-def tokenize_inputs_pt(questions, essays, tokenizer, print_stats=False, max_length=512):
-    input_ids_list = []
-    attention_masks_list = []
-    lengths_token = []
+def tokenize_inputs_pt(questions, essays, tokenizer, print_stats=False, max_length=512, pad_to_multiple_of=None):
+    """
+    Tokenize all (question, essay) pairs in one batched call.
+
+    Sequences are padded only to the longest pair in the batch, rounded up to a
+    multiple of `pad_to_multiple_of` (a length bucket) when given, and never past
+    `max_length`. Pass a fast (Rust) tokenizer for best throughput; slow tokenizers
+    still work through the same batched call.
+    """
+    encoding = tokenizer(
+        list(questions), list(essays),
+        padding="longest",  # Pad only to the longest pair in this batch
+        truncation=True,  # Ensuring truncation for longer inputs
+        max_length=max_length,
+        return_tensors="pt"  # Return in tensor format
+    )
+    input_ids_tensor = encoding["input_ids"]
+    attention_mask_tensor = encoding["attention_mask"]
+
+    if pad_to_multiple_of:
+        longest = input_ids_tensor.shape[1]
+        bucket_length = min(-(-longest // pad_to_multiple_of) * pad_to_multiple_of, max_length)
+        extra = bucket_length - longest
+        if extra > 0:
+            pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+            input_ids_tensor = torch.nn.functional.pad(input_ids_tensor, (0, extra), value=pad_id)
+            attention_mask_tensor = torch.nn.functional.pad(attention_mask_tensor, (0, extra), value=0)
+
+    lengths_token = attention_mask_tensor.sum(dim=1).tolist()
     lengths_sequences = []
-    num_overflow = 0
-    id_list = np.arange(len(questions))
-    
-    for id, q, e in zip(id_list, questions, essays):
-        encoding = tokenizer(
-            q, e,
-            padding="max_length",  # Padding to ensure uniform length
-            truncation=True,  # Ensuring truncation for longer inputs
-            max_length=max_length,  # Optional: set max_length explicitly
-            return_tensors="pt"  # Return in tensor format
-        )
-        input_ids_list.append(encoding["input_ids"].squeeze(0))  # Remove batch dimension
-        attention_masks_list.append(encoding["attention_mask"].squeeze(0))  # Remove batch dimension
-        
-        lengths_token.append(len(encoding["input_ids"]))
+    num_overflow = sum(1 for length in lengths_token if length >= max_length)
+    padded_tokens = attention_mask_tensor.numel()
+    num_padding = padded_tokens - sum(lengths_token)
+    padding_ratio = num_padding / padded_tokens if padded_tokens else 0.0
 
     if print_stats:
         print(f"Max length: {max(lengths_token)}")
         print(f"Min length: {min(lengths_token)}")
         print(f"Average length: {sum(lengths_token) / len(lengths_token):.2f}")
+        print(f"Padded length: {attention_mask_tensor.shape[1]}")
+        print(f"Padding tokens: {num_padding} ({padding_ratio:.2%} of the batch)")
         print(f"Number of overflowed sequences: {num_overflow}")
         print(f"Overflowed sequences ratio: {num_overflow / len(lengths_token):.2%}")
-        for length in lengths_sequences:
-            print(f"Question length: {length[0]}, Essay length: {length[1]} , Score: {length[2]}, ID: {length[3]}")
 
-    # Convert list of tensors into a single tensor
-    input_ids_tensor = torch.stack(input_ids_list, dim=0)  # Stack along batch dimension
-    attention_mask_tensor = torch.stack(attention_masks_list, dim=0)
-    
     return {
         "input_ids": input_ids_tensor,
         "attention_mask": attention_mask_tensor,
         "lengths_token": lengths_token,
         "lengths_sequences": lengths_sequences,
+        "num_padding_tokens": num_padding,
+        "padding_ratio": padding_ratio,
     }
 def round_to_nearest_half_np(x, method='nearest'):
     """
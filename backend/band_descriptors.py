@@ -0,0 +1,150 @@
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from google.genai import types
+
+from metrics import DESCRIPTOR_UPLOADS
+
+load_dotenv()
+
+# Also put the uploaded PDF in a Gemini context cache, so its tokens are not re-processed on every call
+BAND_DESCRIPTOR_CONTEXT_CACHE = os.getenv("BAND_DESCRIPTOR_CONTEXT_CACHE", "false").lower() == "true"
+BAND_DESCRIPTOR_CACHE_TTL_SECONDS = int(os.getenv("BAND_DESCRIPTOR_CACHE_TTL_SECONDS", "3600"))
+# Refresh a handle this long before it expires, so no request is sent with a handle about to go away
+BAND_DESCRIPTOR_REFRESH_MARGIN_SECONDS = int(os.getenv("BAND_DESCRIPTOR_REFRESH_MARGIN_SECONDS", "300"))
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class DescriptorHandleManager:
+    """
+    Process-wide handle to the band descriptor PDF on the Gemini Files API.
+
+    The file is uploaded on first use and reused until shortly before its
+    expiration_time. It is then uploaded again, and the previous copy is deleted.
+    Callers that find the file gone on the server call invalidate(), and the next
+    request uploads it again.
+
+    With use_context_cache=True the file is also put in a cached-content entry
+    for `model`, and requests reference the cache instead of the file. If the cache
+    cannot be created (e.g. the PDF is below the model's minimum cache size), the
+    file part is sent as before.
+
+    `client` is anything with the genai.Client files/caches interface, so tests
+    can pass a local fake.
+    """
+
+    def __init__(self, path: str, client, model: str = "models/gemini-2.0-flash-001",
+                 use_context_cache: bool = BAND_DESCRIPTOR_CONTEXT_CACHE,
+                 cache_ttl_seconds: int = BAND_DESCRIPTOR_CACHE_TTL_SECONDS,
+                 refresh_margin_seconds: int = BAND_DESCRIPTOR_REFRESH_MARGIN_SECONDS,
+                 now=_utcnow):
+        self.path = path
+        self.client = client
+        self.model = model
+        self.use_context_cache = use_context_cache
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.refresh_margin = timedelta(seconds=refresh_margin_seconds)
+        self.now = now
+        self.file = None
+        self.cache = None
+        self._cached_file = None
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, expires_at) -> bool:
+        # Handles without an expiry (e.g. from a fake client) never expire
+        return expires_at is None or expires_at - self.refresh_margin > self.now()
+
+    def _delete_quietly(self, delete, name: str):
+        try:
+            delete(name=name)
+        except Exception as e:
+            print(f"Could not delete {name}: {e}")
+
+    def _upload_file(self):
+        previous = self.file
+        self.file = self.client.files.upload(file=self.path)
+        DESCRIPTOR_UPLOADS.labels("file").inc()
+        print(f"Uploaded band descriptors as {self.file.name}")
+        if previous is not None:
+            self._delete_quietly(self.client.files.delete, previous.name)
+
+    def _create_cache(self):
+        previous = self.cache
+        try:
+            self.cache = self.client.caches.create(
+                model=self.model,
+                config=types.CreateCachedContentConfig(
+                    contents=[self.file],
+                    ttl=f"{self.cache_ttl_seconds}s",
+                    display_name="band-descriptors",
+                ),
+            )
+            DESCRIPTOR_UPLOADS.labels("context_cache").inc()
+        except Exception as e:
+            print(f"Could not create the band descriptor context cache, sending the file instead: {e}")
+            self.cache = None
+        if previous is not None:
+            self._delete_quietly(self.client.caches.delete, previous.name)
+
+    def get_file(self):
+        """
+        The uploaded file, uploading it first if it is missing or about to expire.
+        """
+        with self._lock:
+            if self.file is None or not self._is_fresh(getattr(self.file, "expiration_time", None)):
+                self._upload_file()
+            return self.file
+
+    def get_cache(self):
+        """
+        The cached-content entry for the file, or None when context caching is off or unavailable.
+        """
+        if not self.use_context_cache:
+            return None
+        file = self.get_file()
+        with self._lock:
+            # A failed creation is not retried until the file itself is uploaded again
+            expired = self.cache is not None and not self._is_fresh(getattr(self.cache, "expire_time", None))
+            if expired or self._cached_file is not file:
+                self._create_cache()
+                self._cached_file = file
+            return self.cache
+
+    def generate_content_kwargs(self, prompt: str) -> dict:
+        """
+        contents/config arguments of client.models.generate_content() for a prompt that
+        needs the band descriptors.
+        """
+        cache = self.get_cache()
+        if cache is not None:
+            return {
+                "contents": prompt,
+                "config": types.GenerateContentConfig(cached_content=cache.name),
+            }
+        return {"contents": [self.get_file(), prompt]}
+
+    def invalidate(self):
+        """
+        Forget the current handles, e.g. after the server reported the file as missing.
+        """
+        with self._lock:
+            self.file = None
+            self.cache = None
+            self._cached_file = None
+
+    def release(self):
+        """
+        Delete the uploaded file and context cache, so no orphans are left behind on shutdown.
+        """
+        with self._lock:
+            if self.cache is not None:
+                self._delete_quietly(self.client.caches.delete, self.cache.name)
+            if self.file is not None:
+                self._delete_quietly(self.client.files.delete, self.file.name)
+            self.file = None
+            self.cache = None
+            self._cached_file = None
@@ -0,0 +1,128 @@
+"""
+Benchmark GET /sessions paging against growing numbers of stored sessions.
+
+Usage:
+    python bench_sessions.py [--uri mongodb://localhost:27017] [--sizes 1000 10000 100000 1000000]
+
+Runs against a local mongod unless --uri is given; it never reads MONGODB_URI.
+
+Seeds a scratch database (--db, dropped first unless --keep) with synthetic session
+documents up to each size in turn, creates the startup indexes, and times the
+same query the endpoint runs (database.list_sessions_page): the first page, the page
+100 pages deep (or the last page) reached by following cursors, and a
+question-filtered page. It also times the old unpaginated listing up to
+--full-scan-max sessions for comparison.
+With the (created_at, _id) index the paged timings should stay flat as the
+collection grows.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from database import SESSIONS_COLLECTION, ensure_indexes, list_sessions_page, session_document
+
+QUESTIONS = [
+    "Some people think that universities should provide graduates with the knowledge and skills needed in the workplace.",
+    "In many countries, the proportion of older people is steadily increasing.",
+    "Some people believe that unpaid community service should be a compulsory part of high school programmes.",
+    "Many people prefer to watch foreign films rather than locally produced films.",
+]
+# Stands in for the stored essay and LLM response, which the list projection must not read
+FILLER = "lorem ipsum " * 100
+
+
+async def seed(collection, start: int, stop: int, batch_size: int = 10000):
+    base = datetime(2024, 1, 1)
+    for offset in range(start, stop, batch_size):
+        docs = [
+            session_document(
+                str(uuid.uuid4()),
+                f"{random.choice(QUESTIONS)} #{i % 97}",
+                FILLER,
+                {"overall_feedback": FILLER},
+                {"word_count": 300},
+                [],
+                base + timedelta(seconds=i),
+            )
+            for i in range(offset, min(offset + batch_size, stop))
+        ]
+        await collection.insert_many(docs, ordered=False)
+
+
+async def timed(call, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        await call()
+        samples.append((time.perf_counter() - start_time) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(0.95 * (len(samples) - 1))]
+
+
+async def run(args):
+    client = AsyncIOMotorClient(args.uri)
+    db = client[args.db]
+    if not args.keep:
+        await client.drop_database(args.db)
+    await ensure_indexes(db)
+    collection = db[SESSIONS_COLLECTION]
+
+    async def deep_cursor(pages: int):
+        # Follow next_cursor the way a client scrolling through the list would
+        cursor = None
+        for _ in range(pages):
+            _, next_cursor = await list_sessions_page(db, args.limit, cursor)
+            if next_cursor is None:
+                break
+            cursor = next_cursor
+        return cursor
+
+    async def full_scan():
+        await collection.find({}, {"session_id": 1, "question": 1, "created_at": 1}).sort("created_at", -1).to_list(None)
+
+    print(f"{'sessions':>10} {'first p50':>10} {'first p95':>10} {'deep p50':>10} {'filter p50':>11} {'full scan':>10}  (ms)")
+    seeded = await collection.estimated_document_count()
+    for size in sorted(args.sizes):
+        if seeded < size:
+            await seed(collection, seeded, size)
+            seeded = size
+
+        first_p50, first_p95 = await timed(lambda: list_sessions_page(db, args.limit), args.repeat)
+        cursor = await deep_cursor(100)
+        deep_p50, _ = await timed(lambda: list_sessions_page(db, args.limit, cursor), args.repeat)
+        filter_p50, _ = await timed(lambda: list_sessions_page(db, args.limit, question="#42"), args.repeat)
+        scan = "skipped"
+        if size <= args.full_scan_max:
+            scan_p50, _ = await timed(full_scan, 3)
+            scan = f"{scan_p50:.1f}"
+        print(f"{size:>10} {first_p50:>10.2f} {first_p95:>10.2f} {deep_p50:>10.2f} {filter_p50:>11.2f} {scan:>10}")
+
+    if not args.keep:
+        await client.drop_database(args.db)
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    # Never defaults to MONGODB_URI: seeding a million documents into the app's cluster must be explicit
+    parser.add_argument("--uri", default="mongodb://localhost:27017",
+                        help="MongoDB to seed and benchmark (default: a local mongod)")
+    parser.add_argument("--db", default="essay_sessions_bench")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--full-scan-max", type=int, default=100000,
+                        help="Largest size at which the old unpaginated listing is timed")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database between runs")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import os
+import numpy as np
+import torch
+import torch.nn as nn
+from BERTWithExtraFeature import export_frozen_scorer
+
+
+class EagerBertBackend:
+    """
+    The original fp32 PyTorch model, run eagerly.
+    """
+    name = "eager"
+    # Whether predict() expects StandardScaler-normalized word counts (True) or raw counts (False)
+    standardize_features = True
+
+    def __init__(self, model: nn.Module):
+        self.model = model.eval()
+
+    def predict(self, input_ids, attention_mask, extra_number):
+        """
+        Return (scores, pooled_output) for a batch: the raw (unrounded) scores as a 1-D
+        NumPy array and the pooled BERT output as an (n, 768) array.
+        """
+        with torch.no_grad():
+            output, pooled_output = self.model(input_ids, attention_mask, extra_number, return_pooled=True)
+        return output.cpu().numpy()[:, 0], pooled_output.cpu().numpy()
+
+
+class QuantizedBertBackend(EagerBertBackend):
+    """
+    PyTorch dynamic INT8 quantization of every nn.Linear (BERT encoder and scoring head).
+    Weights are stored as int8 and activations are quantized on the fly, which needs
+    no calibration data and runs well on CPU.
+    """
+    name = "int8"
+
+    def __init__(self, model: nn.Module):
+        quantized = torch.quantization.quantize_dynamic(model.eval(), {nn.Linear}, dtype=torch.qint8)
+        super().__init__(quantized)
+
+
+class OnnxBertBackend:
+    """
+    The model exported to ONNX and run with ONNX Runtime on the CPU execution provider.
+    The graph is exported to `onnx_path` on first use and reused afterwards.
+    """
+    name = "onnx"
+    standardize_features = True
+
+    def __init__(self, model: nn.Module, onnx_path: str, intra_op_threads: int = 0):
+        import onnxruntime as ort
+
+        if not os.path.exists(onnx_path):
+            export_bert_onnx(model, onnx_path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+    def predict(self, input_ids, attention_mask, extra_number):
+        if extra_number.dim() == 1:
+            extra_number = extra_number.unsqueeze(1)
+        outputs = self.session.run(None, {
+            "input_ids": input_ids.cpu().numpy().astype(np.int64),
+            "attention_mask": attention_mask.cpu().numpy().astype(np.int64),
+            "extra_number": extra_number.cpu().numpy().astype(np.float32),
+        })
+        # Graphs exported before the pooled output was added only have the score
+        pooled_output = outputs[1] if len(outputs) > 1 else None
+        return outputs[0][:, 0], pooled_output
+
+
+class FrozenBertBackend(EagerBertBackend):
+    """
+    The frozen TorchScript FrozenBERTScorer saved by export_frozen_scorer.py. The scaler and
+    BatchNorm are folded into the graph, so it takes raw word counts and the training
+    module does not need to be built at startup.
+    """
+    name = "frozen"
+    standardize_features = False
+
+    def __init__(self, frozen_path: str):
+        super().__init__(torch.jit.load(frozen_path, map_location="cpu"))
+
+    def predict(self, input_ids, attention_mask, extra_number):
+        with torch.no_grad():
+            outputs = self.model(input_ids, attention_mask, extra_number)
+        if isinstance(outputs, tuple):
+            output, pooled_output = outputs
+            return output.cpu().numpy()[:, 0], pooled_output.cpu().numpy()
+        # Artifacts exported before the pooled output was added only have the score
+        return outputs.cpu().numpy()[:, 0], None
+
+
+class _ScoreAndPooled(nn.Module):
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, extra_number):
+        return self.model(input_ids, attention_mask, extra_number, return_pooled=True)
+
+
+def export_bert_onnx(model: nn.Module, onnx_path: str, opset_version: int = 17):
+    """
+    Export BERTWithExtraFeature to ONNX with dynamic batch and sequence axes.
+    The graph has two outputs: "score" and "pooled_output".
+    """
+    os.makedirs(os.path.dirname(onnx_path) or ".", exist_ok=True)
+    model = _ScoreAndPooled(model.eval()).eval()
+    dummy_input_ids = torch.ones((2, 16), dtype=torch.long)
+    dummy_attention_mask = torch.ones((2, 16), dtype=torch.long)
+    dummy_extra_number = torch.zeros((2, 1), dtype=torch.float32)
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy_input_ids, dummy_attention_mask, dummy_extra_number),
+            onnx_path,
+            input_names=["input_ids", "attention_mask", "extra_number"],
+            output_names=["score", "pooled_output"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "extra_number": {0: "batch"},
+                "score": {0: "batch"},
+                "pooled_output": {0: "batch"},
+            },
+            opset_version=opset_version,
+        )
+    print(f"Exported BERT scorer to {onnx_path}")
+
+
+BERT_BACKENDS = ("eager", "int8", "onnx", "frozen")
+
+
+def load_bert_backend(name: str, model: nn.Module, onnx_path: str = "artifacts/bert_scorer.onnx", intra_op_threads: int = 0,
+                      scaler=None, frozen_path: str = "artifacts/bert_scorer_frozen.pt"):
+    """
+    Build the inference backend called `name` around the loaded eager model.
+    For "frozen", `model` may be None when the artifact at `frozen_path` already exists;
+    otherwise it is exported from `model` and `scaler` first.
+    """
+    if name == "eager":
+        return EagerBertBackend(model)
+    if name == "int8":
+        return QuantizedBertBackend(model)
+    if name == "onnx":
+        return OnnxBertBackend(model, onnx_path, intra_op_threads=intra_op_threads)
+    if name == "frozen":
+        if not os.path.exists(frozen_path):
+            os.makedirs(os.path.dirname(frozen_path) or ".", exist_ok=True)
+            export_frozen_scorer(model, scaler, frozen_path)
+            print(f"Exported frozen BERT scorer to {frozen_path}")
+        return FrozenBertBackend(frozen_path)
+    raise ValueError(f"Unknown BERT backend {name!r}, expected one of {BERT_BACKENDS}")
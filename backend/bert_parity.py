@@ -0,0 +1,95 @@
+"""
+Compare the band scores of the alternative BERT backends against the eager fp32 model.
+
+Usage:
+    python bert_parity.py --essays reference_essays.csv [--backends int8 onnx frozen] [--tolerance 0.5]
+
+Run it with BERT_BACKEND=eager (the default) so the eager reference model is loaded.
+
+The reference set is a CSV or JSONL file with "question" and "answer" fields. A backend
+passes when no rounded band score differs from the eager model by more than
+--tolerance and at least --min-agreement of the scores match exactly. The report
+also lists seconds per essay, so the fastest passing backend can be chosen with
+BERT_BACKEND.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import numpy as np
+
+from BERTWithExtraFeature import round_to_nearest_half_np, preprocess_batch_inputs_pt
+from bert_backends import load_bert_backend
+import bert_setup
+
+
+def load_reference_essays(path: str):
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path, encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+    return [(str(row["question"]), str(row["answer"])) for row in rows]
+
+
+def score_with_backend(backend, essays, batch_size: int):
+    loaded = bert_setup.get_bert()
+    scores = []
+    start_time = time.perf_counter()
+    for i in range(0, len(essays), batch_size):
+        batch = essays[i:i + batch_size]
+        input_ids, attention_mask, extra_number = preprocess_batch_inputs_pt(
+            [q for q, _ in batch], [a for _, a in batch],
+            loaded.tokenizer, loaded.scaler if backend.standardize_features else None, bert_setup.device,
+            max_length=512, pad_to_multiple_of=bert_setup.BERT_PAD_BUCKET or None
+        )
+        scores.append(backend.predict(input_ids, attention_mask, extra_number)[0])
+    elapsed = time.perf_counter() - start_time
+    return round_to_nearest_half_np(np.concatenate(scores), method='nearest'), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays", required=True, help="CSV or JSONL file with question/answer fields")
+    parser.add_argument("--backends", nargs="+", default=["int8", "onnx"])
+    parser.add_argument("--tolerance", type=float, default=float(os.getenv("BERT_PARITY_TOLERANCE", "0.5")),
+                        help="Maximum allowed difference in rounded band score")
+    parser.add_argument("--min-agreement", type=float, default=float(os.getenv("BERT_PARITY_MIN_AGREEMENT", "0.95")),
+                        help="Minimum fraction of essays whose rounded score must match exactly")
+    parser.add_argument("--batch-size", type=int, default=bert_setup.BERT_MAX_BATCH_SIZE)
+    args = parser.parse_args()
+
+    essays = load_reference_essays(args.essays)
+    if not essays:
+        sys.exit(f"No essays found in {args.essays}")
+
+    loaded = bert_setup.get_bert()
+    if loaded.model is None:
+        sys.exit("The eager model is not loaded; run bert_parity.py with BERT_BACKEND=eager")
+
+    reference = load_bert_backend("eager", loaded.model)
+    reference_scores, reference_time = score_with_backend(reference, essays, args.batch_size)
+    print(f"{'backend':<8} {'agreement':>10} {'max diff':>9} {'mean diff':>10} {'s/essay':>9}  result")
+    print(f"{'eager':<8} {1.0:>10.2%} {0.0:>9.2f} {0.0:>10.3f} {reference_time / len(essays):>9.4f}  reference")
+
+    all_passed = True
+    for name in args.backends:
+        backend = load_bert_backend(
+            name, loaded.model, onnx_path=bert_setup.BERT_ONNX_PATH,
+            scaler=loaded.scaler, frozen_path=bert_setup.BERT_FROZEN_PATH
+        )
+        scores, elapsed = score_with_backend(backend, essays, args.batch_size)
+        diff = np.abs(scores - reference_scores)
+        agreement = float(np.mean(diff == 0))
+        passed = diff.max() <= args.tolerance and agreement >= args.min_agreement
+        all_passed = all_passed and passed
+        print(f"{name:<8} {agreement:>10.2%} {diff.max():>9.2f} {diff.mean():>10.3f} {elapsed / len(essays):>9.4f}  {'PASS' if passed else 'FAIL'}")
+
+    sys.exit(0 if all_passed else 1)
+
+
+if __name__ == "__main__":
+    main()
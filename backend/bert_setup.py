@@ -1,37 +1,207 @@
-import pandas as pd
-from transformers import  BertTokenizer
+from types import SimpleNamespace
+from transformers import BertConfig, BertTokenizerFast
 import numpy as np
 import torch
 import os
 import joblib
-from huggingface_hub import login, hf_hub_download
 from dotenv import load_dotenv
-from BERTWithExtraFeature import BERTWithExtraFeature, round_to_nearest_half_np, preprocess_inputs_pt
-# from transformers import AutoConfig
+from BERTWithExtraFeature import BERTWithExtraFeature, round_to_nearest_half_np, preprocess_batch_inputs_pt
+from bert_backends import load_bert_backend
+from micro_batcher import MicroBatcher
+from inference_executor import get_inference_executor
+from model_registry import BERT_REPO_ID, MODEL_REVISIONS, LazyModel, pretrained_kwargs, resolve_artifact, resolve_repo, timed_phase
+from score_cache import essay_cache_key, score_cache
+from metrics import observe_bert_tokens, stage_timer, track_batcher
 load_dotenv()
-login(os.getenv("IELTS_HUGGINGFACE_API_KEY"))
-bert_tokenizer = BertTokenizer.from_pretrained("nghes/IELTS-BertwitthhExtraFeature")
-model = BERTWithExtraFeature()
 device = "cpu"
-model_path = hf_hub_download(
-    repo_id="nghes/IELTS-BertwitthhExtraFeature",
-    filename="pytorch_model.bin"
-)
-model.load_state_dict(torch.load(model_path, map_location="cpu"))
-scaler_path = hf_hub_download(
-    repo_id="nghes/IELTS-BertwitthhExtraFeature",
-    filename="scaler.pkl"
-)
-scaler = joblib.load(scaler_path)
+
+# Inference backend: "eager" (fp32 PyTorch), "int8" (dynamic quantization), "onnx" (ONNX Runtime)
+# or "frozen" (TorchScript graph with the scaler and BatchNorm folded in, see export_frozen_scorer.py).
+# Use bert_parity.py to check a backend against the eager model before switching.
+BERT_BACKEND = os.getenv("BERT_BACKEND", "eager")
+BERT_ONNX_PATH = os.getenv("BERT_ONNX_PATH", "artifacts/bert_scorer.onnx")
+BERT_FROZEN_PATH = os.getenv("BERT_FROZEN_PATH", "artifacts/bert_scorer_frozen.pt")
+# Part of every score cache key: scores of other weights or backends are never reused
+SCORE_MODEL_VERSION = f"{BERT_REPO_ID}@{MODEL_REVISIONS[BERT_REPO_ID]}/{BERT_BACKEND}"
+
+def load_training_model(phases=None):
+    phases = phases if phases is not None else {}
+    with timed_phase(phases, "construct_model"):
+        # bert-base-uncased architecture; every weight comes from the fine-tuned state_dict below
+        model = BERTWithExtraFeature(bert_config=BertConfig())
+    with timed_phase(phases, "fetch_weights"):
+        model_path = resolve_artifact(BERT_REPO_ID, "pytorch_model.bin")
+    with timed_phase(phases, "load_state_dict"):
+        model.load_state_dict(torch.load(model_path, map_location="cpu"))
+    return model.eval()
+
+def _load_bert(phases):
+    with timed_phase(phases, "tokenizer"):
+        tokenizer = BertTokenizerFast.from_pretrained(resolve_repo(BERT_REPO_ID), **pretrained_kwargs(BERT_REPO_ID))
+    with timed_phase(phases, "scaler"):
+        scaler = joblib.load(resolve_artifact(BERT_REPO_ID, "scaler.pkl"))
+
+    # The frozen artifact replaces the training module entirely once it has been exported
+    if BERT_BACKEND == "frozen" and os.path.exists(BERT_FROZEN_PATH):
+        model = None
+    else:
+        model = load_training_model(phases)
+
+    with timed_phase(phases, "backend"):
+        backend = load_bert_backend(
+            BERT_BACKEND, model, onnx_path=BERT_ONNX_PATH,
+            intra_op_threads=int(os.getenv("BERT_TORCH_THREADS", "0")),
+            scaler=scaler, frozen_path=BERT_FROZEN_PATH
+        )
+    print(f"BERT scorer loaded with the {backend.name} backend")
+    return SimpleNamespace(tokenizer=tokenizer, scaler=scaler, model=model, backend=backend)
+
+bert = LazyModel("bert", _load_bert)
+
+def get_bert():
+    """
+    The loaded scorer (tokenizer, scaler, model, backend), loading it on first use.
+    """
+    return bert.get()
+
+# Micro-batching: concurrent requests wait at most BERT_BATCH_WINDOW_MS to share one forward pass
+BERT_MAX_BATCH_SIZE = int(os.getenv("BERT_MAX_BATCH_SIZE", "16"))
+BERT_BATCH_WINDOW_MS = float(os.getenv("BERT_BATCH_WINDOW_MS", "10"))
+# Batches are padded to the longest essay, rounded up to a multiple of this (0 disables bucketing)
+BERT_PAD_BUCKET = int(os.getenv("BERT_PAD_BUCKET", "32"))
 
 def get_overall_score(question, answer):
-    # preprocess the input
-    input_ids, attention_mask, extra_number = preprocess_inputs_pt(question, answer, bert_tokenizer, scaler, device, max_length=512)
-
-    model.eval()  # Set the model to evaluation mode
-    with torch.no_grad():  # No gradient computation during testing
-        output = model(input_ids, attention_mask, extra_number)
-        output = output.cpu().numpy()
-        score = round_to_nearest_half_np(output, method='nearest')
-        
-    return score[0][0]
+    return get_overall_scores([question], [answer])[0]
+
+def predict_raw_scores(questions, answers):
+    """
+    Run one batched forward pass without rounding. Returns (raw scores, pooled outputs,
+    real token count of each row, padded sequence length).
+    """
+    loaded = get_bert()
+    # With BERT_EXECUTOR=process these two stages are observed in the worker and not exported
+    with stage_timer("bert_tokenize"):
+        input_ids, attention_mask, extra_number = preprocess_batch_inputs_pt(
+            questions, answers, loaded.tokenizer, loaded.scaler if loaded.backend.standardize_features else None, device,
+            max_length=512, pad_to_multiple_of=BERT_PAD_BUCKET or None
+        )
+    # Token counts go back to the caller, which exports them: with BERT_EXECUTOR=process
+    # this function runs in a worker whose metrics are never scraped
+    row_tokens = attention_mask.sum(dim=1).tolist()
+    padded_length = attention_mask.shape[1]
+
+    with stage_timer("bert_forward"):
+        output, pooled_output = loaded.backend.predict(input_ids, attention_mask, extra_number)
+    return output, pooled_output, row_tokens, padded_length
+
+def get_overall_scores(questions, answers, return_pooled=False):
+    """
+    Score a batch of (question, answer) pairs with a single forward pass.
+    Returns a NumPy array of scores rounded to the nearest 0.5, in input order,
+    and the pooled BERT outputs as well when return_pooled is True.
+    """
+    output, pooled_output, _, _ = predict_raw_scores(questions, answers)
+    scores = round_to_nearest_half_np(output, method='nearest')
+    if return_pooled:
+        return scores, pooled_output
+    return scores
+
+def _score_batch(pairs):
+    questions = [question for question, _ in pairs]
+    answers = [answer for _, answer in pairs]
+    output, pooled_output, row_tokens, padded_length = predict_raw_scores(questions, answers)
+    scores = round_to_nearest_half_np(output, method='nearest')
+    if pooled_output is None:
+        pooled_output = [None] * len(scores)
+    # Each row carries its real and padding token counts back to the event loop process
+    return [
+        (float(score), pooled, tokens, padded_length - tokens)
+        for score, pooled, tokens in zip(scores, pooled_output, row_tokens)
+    ]
+
+def warmup():
+    """
+    Load the scorer and run one synthetic batch through it. Returns the phase timings.
+    """
+    get_bert()
+    phases = dict(bert.phases)
+    with timed_phase(phases, "warmup"):
+        get_overall_scores(
+            ["Some people think that technology makes life easier. Discuss."],
+            ["Technology has changed the way people live and work in many ways. " * 20]
+        )
+    return phases
+
+bert_batcher = MicroBatcher(
+    _score_batch,
+    max_batch_size=BERT_MAX_BATCH_SIZE,
+    window_ms=BERT_BATCH_WINDOW_MS,
+    executor=get_inference_executor("bert")
+)
+track_batcher("bert", bert_batcher)
+
+async def score_essay(question, answer):
+    """
+    Score one essay. Repeat submissions are answered from the score cache; everything
+    else goes through the shared micro-batcher, so concurrent callers are grouped
+    into a single batched forward pass.
+    """
+    key = essay_cache_key(question, answer, SCORE_MODEL_VERSION)
+    cached = await score_cache.get(key)
+    if cached is not None:
+        return cached["score"]
+
+    # Includes the wait for the batch window and for the executor
+    with stage_timer("bert_score"):
+        score, pooled, real_tokens, padding_tokens = await bert_batcher.submit((question, answer))
+    observe_bert_tokens(real_tokens, padding_tokens)
+    await score_cache.put(key, score, pooled)
+    return score
+
+def _predict_raw_batches(pairs, batch_size):
+    outputs, pooled_outputs = [], []
+    real_tokens = padding_tokens = 0
+    for i in range(0, len(pairs), batch_size):
+        batch = pairs[i:i + batch_size]
+        output, pooled_output, row_tokens, padded_length = predict_raw_scores([q for q, _ in batch], [a for _, a in batch])
+        real_tokens += sum(row_tokens)
+        padding_tokens += padded_length * len(row_tokens) - sum(row_tokens)
+        outputs.append(output)
+        if pooled_output is None:
+            pooled_outputs.extend([None] * len(batch))
+        else:
+            pooled_outputs.extend(pooled_output)
+    return np.concatenate(outputs), pooled_outputs, real_tokens, padding_tokens
+
+async def score_essays(pairs):
+    """
+    Score a list of (question, answer) pairs and return the rounded scores in input order.
+
+    Cached essays are answered from the score cache and duplicates inside the list are
+    scored once. Everything else runs in batched forward passes of BERT_MAX_BATCH_SIZE
+    on the "bert" executor, and the whole batch is rounded in one vectorized call.
+    """
+    keys = [essay_cache_key(question, answer, SCORE_MODEL_VERSION) for question, answer in pairs]
+    scores = {}
+    to_score = {}
+    for key, pair in zip(keys, pairs):
+        if key in scores or key in to_score:
+            continue
+        cached = await score_cache.get(key)
+        if cached is not None:
+            scores[key] = cached["score"]
+        else:
+            to_score[key] = pair
+
+    if to_score:
+        with stage_timer("bert_score"):
+            raw_outputs, pooled_outputs, real_tokens, padding_tokens = await get_inference_executor("bert").run(
+                _predict_raw_batches, list(to_score.values()), BERT_MAX_BATCH_SIZE
+            )
+        observe_bert_tokens(real_tokens, padding_tokens)
+        rounded = round_to_nearest_half_np(raw_outputs, method='nearest')
+        for key, score, pooled in zip(to_score, rounded.tolist(), pooled_outputs):
+            scores[key] = score
+            await score_cache.put(key, score, pooled)
+
+    return [scores[key] for key in keys]
@@ -0,0 +1,205 @@
+import asyncio
+import os
+import threading
+from dataclasses import dataclass, field
+
+import httpx
+from dotenv import load_dotenv
+from google import genai
+from google.genai import types
+
+from band_descriptors import DescriptorHandleManager
+from llm_dispatch import GeminiKeyPool, OllamaDispatcher
+from metrics import track_http_pool
+
+load_dotenv()
+
+# Ollama connection pool and timeouts
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "20"))
+OLLAMA_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OLLAMA_MAX_KEEPALIVE_CONNECTIONS", "10"))
+OLLAMA_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY_SECONDS", "60"))
+OLLAMA_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_CONNECT_TIMEOUT_SECONDS", "10"))
+OLLAMA_READ_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_READ_TIMEOUT_SECONDS", "180"))
+# Gemini request timeout; each key keeps its own client (and connection pool) for the whole process
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "120"))
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "100"))
+GEMINI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GEMINI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+
+def gemini_api_keys() -> list:
+    """
+    The Gemini key pool: GEMINI_API_KEY, GEMINI_API_KEY_2, GEMINI_API_KEY_3 and any extra
+    comma-separated keys in GEMINI_API_KEYS, without duplicates.
+    """
+    keys = [os.getenv("GEMINI_API_KEY"), os.getenv("GEMINI_API_KEY_2"), os.getenv("GEMINI_API_KEY_3")]
+    keys += os.getenv("GEMINI_API_KEYS", "").split(",")
+    return list(dict.fromkeys(key.strip() for key in keys if key and key.strip()))
+
+
+class _CountedStream(httpx.SyncByteStream):
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+
+    def __iter__(self):
+        yield from self.stream
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.release()
+
+
+class _AsyncCountedStream(httpx.AsyncByteStream):
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            self.release()
+
+
+class InFlightTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """
+    Wraps an httpx transport (sync or async) and counts the requests it is handling,
+    from sending the request until the response body is closed. Each client talks to a
+    single host, so up to `max_connections` of them hold a pooled connection and the
+    rest are waiting for one.
+    """
+
+    def __init__(self, transport, max_connections: int):
+        self.transport = transport
+        self.max_connections = max_connections
+        self.in_flight = 0
+        # The sync Gemini clients are called from worker threads
+        self._lock = threading.Lock()
+
+    def _add(self, count: int):
+        with self._lock:
+            self.in_flight += count
+
+    def _release_once(self):
+        released = []
+
+        def release():
+            if not released:
+                released.append(True)
+                self._add(-1)
+        return release
+
+    def handle_request(self, request):
+        self._add(1)
+        release = self._release_once()
+        try:
+            response = self.transport.handle_request(request)
+        except BaseException:
+            release()
+            raise
+        return httpx.Response(response.status_code, headers=response.headers, extensions=response.extensions,
+                              stream=_CountedStream(response.stream, release))
+
+    async def handle_async_request(self, request):
+        self._add(1)
+        release = self._release_once()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        return httpx.Response(response.status_code, headers=response.headers, extensions=response.extensions,
+                              stream=_AsyncCountedStream(response.stream, release))
+
+    def close(self):
+        self.transport.close()
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+@dataclass
+class LLMClients:
+    """
+    Long-lived LLM clients owned by the app lifespan and passed into the pipeline functions.
+    """
+    ollama: httpx.AsyncClient
+    ollama_dispatch: OllamaDispatcher
+    gemini_pool: GeminiKeyPool
+    # Key slot name -> band descriptor handle uploaded with that key (files belong to a key's project)
+    band_descriptors: dict = field(default_factory=dict)
+    # Key slot name -> the httpx client the genai client of that key sends its requests through
+    gemini_http: dict = field(default_factory=dict)
+
+    async def aclose(self):
+        await self.ollama.aclose()
+        for band_descriptors in self.band_descriptors.values():
+            await asyncio.to_thread(band_descriptors.release)
+        for http_client in self.gemini_http.values():
+            http_client.close()
+
+
+def create_ollama_transport() -> InFlightTransport:
+    # A custom transport replaces the client's own pool, so the limits go on the transport
+    limits = httpx.Limits(
+        max_connections=OLLAMA_MAX_CONNECTIONS,
+        max_keepalive_connections=OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY_SECONDS,
+    )
+    return InFlightTransport(httpx.AsyncHTTPTransport(limits=limits), OLLAMA_MAX_CONNECTIONS)
+
+
+def create_ollama_client(transport: InFlightTransport) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=transport,
+        timeout=httpx.Timeout(OLLAMA_READ_TIMEOUT_SECONDS, connect=OLLAMA_CONNECT_TIMEOUT_SECONDS),
+    )
+
+
+def create_gemini_transport() -> InFlightTransport:
+    limits = httpx.Limits(max_connections=GEMINI_MAX_CONNECTIONS,
+                          max_keepalive_connections=GEMINI_MAX_KEEPALIVE_CONNECTIONS)
+    return InFlightTransport(httpx.HTTPTransport(limits=limits), GEMINI_MAX_CONNECTIONS)
+
+
+def create_gemini_client(api_key: str, http_client: httpx.Client) -> genai.Client:
+    # HttpOptions.timeout is in milliseconds; genai applies it to every request it sends through http_client
+    return genai.Client(api_key=api_key, http_options=types.HttpOptions(
+        timeout=int(GEMINI_TIMEOUT_SECONDS * 1000),
+        httpx_client=http_client,
+    ))
+
+
+def create_clients(band_descriptor_file: str = os.getenv("BAND_DISCRIPTIOR_FILE")) -> LLMClients:
+    """
+    Build the Ollama client and dispatcher, the Gemini key pool (one client per key) and
+    a band descriptor handle per key. The httpx clients are created here and owned by
+    LLMClients; the requests in flight on each one are exported on /metrics.
+    """
+    ollama_transport = create_ollama_transport()
+    ollama = create_ollama_client(ollama_transport)
+    track_http_pool("ollama", ollama_transport)
+
+    gemini = {}
+    gemini_http = {}
+    for i, api_key in enumerate(gemini_api_keys(), start=1):
+        # Slots are named by position so keys never end up in metric labels
+        name = f"gemini_{i}"
+        transport = create_gemini_transport()
+        gemini_http[name] = httpx.Client(transport=transport, timeout=GEMINI_TIMEOUT_SECONDS)
+        gemini[name] = create_gemini_client(api_key, gemini_http[name])
+        track_http_pool(name, transport)
+
+    return LLMClients(
+        ollama=ollama,
+        ollama_dispatch=OllamaDispatcher(),
+        gemini_pool=GeminiKeyPool(gemini),
+        band_descriptors={name: DescriptorHandleManager(band_descriptor_file, client) for name, client in gemini.items()},
+        gemini_http=gemini_http,
+    )
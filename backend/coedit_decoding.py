@@ -0,0 +1,85 @@
+import math
+import os
+import torch
+from dotenv import load_dotenv
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+load_dotenv()
+
+# Decoding profiles for CoEdIT, selected with COEDIT_DECODING_PROFILE.
+#   num_beams:    1 = greedy search
+#   length_ratio, slack: max_new_tokens = ceil(input_tokens * length_ratio) + slack
+#   early_exit:   stop a chunk as soon as its output reproduces the input verbatim (greedy only).
+#                 Lossy: a correction that only appends to the input (e.g. a missing final
+#                 period) is cut at the reproduced prefix, so the chunk comes back unchanged.
+#                 In exchange a mostly-correct essay frees its rows before they emit EOS.
+#                 Only greedy-early-exit turns it on.
+#   static_cache: use a static KV cache when the model supports it
+DECODING_PROFILES = {
+    "greedy": {"num_beams": 1, "length_ratio": 1.1, "slack": 8, "early_exit": False, "static_cache": False},
+    "greedy-static": {"num_beams": 1, "length_ratio": 1.1, "slack": 8, "early_exit": False, "static_cache": True},
+    "greedy-early-exit": {"num_beams": 1, "length_ratio": 1.1, "slack": 8, "early_exit": True, "static_cache": False},
+    "beam2": {"num_beams": 2, "length_ratio": 1.2, "slack": 8, "early_exit": False, "static_cache": False},
+    "beam4": {"num_beams": 4, "length_ratio": 1.25, "slack": 12, "early_exit": False, "static_cache": False},
+}
+COEDIT_DECODING_PROFILE = os.getenv("COEDIT_DECODING_PROFILE", "greedy")
+
+
+def get_decoding_profile(name: str = None) -> dict:
+    name = name or COEDIT_DECODING_PROFILE
+    if name not in DECODING_PROFILES:
+        raise ValueError(f"Unknown CoEdIT decoding profile {name!r}, expected one of {list(DECODING_PROFILES)}")
+    profile = dict(DECODING_PROFILES[name], name=name)
+    if os.getenv("COEDIT_OUTPUT_SLACK_TOKENS"):
+        profile["slack"] = int(os.getenv("COEDIT_OUTPUT_SLACK_TOKENS"))
+    return profile
+
+
+def max_new_tokens_for(input_length: int, profile: dict) -> int:
+    # A correction is about as long as its input; leave room for inserted words instead of truncating
+    return math.ceil(input_length * profile["length_ratio"]) + profile["slack"]
+
+
+class ReproducedInputCriteria(StoppingCriteria):
+    """
+    Marks a sequence finished once the decoder output is exactly the chunk's own tokens,
+    i.e. the model has reproduced an unchanged chunk. It only needs one comparison per
+    row and step, at the step where the lengths match.
+
+    This is a prefix match: the row is stopped even if the model would have gone on to
+    append text (such as a final period), so it may drop real corrections.
+    """
+
+    def __init__(self, target_ids: list, device):
+        self.targets = [torch.tensor(ids, dtype=torch.long, device=device) for ids in target_ids]
+        self.exited = set()
+
+    def __call__(self, input_ids, scores, **kwargs):
+        generated = input_ids[:, 1:]  # skip the decoder start token
+        length = generated.shape[1]
+        done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        for row, target in enumerate(self.targets):
+            if len(target) == length and torch.equal(generated[row], target):
+                done[row] = True
+                self.exited.add(row)
+        return done
+
+
+def generation_kwargs(model, profile: dict, input_length: int, target_ids: list = None, device=None):
+    """
+    Keyword arguments for model.generate() under `profile`. Returns (kwargs, early_exit_criteria),
+    where the criteria object is None when early exit does not apply.
+    """
+    kwargs = {
+        "max_new_tokens": max_new_tokens_for(input_length, profile),
+        "num_beams": profile["num_beams"],
+        "do_sample": False,
+    }
+    if profile["static_cache"] and getattr(model, "_supports_static_cache", False):
+        kwargs["cache_implementation"] = "static"
+
+    criteria = None
+    if profile["early_exit"] and profile["num_beams"] == 1 and target_ids is not None:
+        criteria = ReproducedInputCriteria(target_ids, device)
+        kwargs["stopping_criteria"] = StoppingCriteriaList([criteria])
+    return kwargs, criteria
@@ -0,0 +1,89 @@
+import os
+import re
+import unicodedata
+from dotenv import load_dotenv
+
+from lru_cache import LRUCache
+from metrics import CACHE_HITS, CACHE_MISSES, track_lru_cache
+
+load_dotenv()
+
+CORRECTION_CACHE_MAX_ENTRIES = int(os.getenv("CORRECTION_CACHE_MAX_ENTRIES", "50000"))
+CORRECTION_CACHE_MAX_BYTES = int(os.getenv("CORRECTION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+
+def normalize_chunk(text: str) -> str:
+    # Annotation compares whitespace-split words, so whitespace differences never change the result
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def split_sentences(text: str) -> list:
+    return [sentence for sentence in SENTENCE_BOUNDARY.split(text.strip()) if sentence]
+
+
+class CorrectionCache:
+    """
+    LRU cache of CoEdIT corrections at two granularities.
+
+    - chunk: normalized chunk text -> corrected chunk.
+    - sentence: normalized sentence -> corrected sentence. These entries are recorded
+      whenever a chunk's correction has the same number of sentences as its input.
+
+    When a revised essay is resubmitted, the chunk boundaries may shift even though most
+    sentences are unchanged. A chunk whose sentences are all cached is then rebuilt from
+    the sentence tier, and only chunks containing edited text are sent to the model.
+    """
+
+    def __init__(self, max_entries: int = CORRECTION_CACHE_MAX_ENTRIES, max_bytes: int = CORRECTION_CACHE_MAX_BYTES):
+        self.chunks = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self.sentences = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        track_lru_cache("grammar_chunk", self.chunks)
+        track_lru_cache("grammar_sentence", self.sentences)
+
+    def lookup(self, chunk: str):
+        """
+        Return the cached correction of `chunk`, or None if it has to be generated.
+        """
+        if not chunk.strip():
+            return chunk
+
+        corrected = self.chunks.get(normalize_chunk(chunk))
+        if corrected is not None:
+            CACHE_HITS.labels("grammar", "chunk").inc()
+            return corrected
+
+        sentences = split_sentences(chunk)
+        corrected_sentences = [self.sentences.get(normalize_chunk(sentence)) for sentence in sentences]
+        if sentences and all(corrected is not None for corrected in corrected_sentences):
+            corrected = " ".join(corrected_sentences)
+            self.chunks.put(normalize_chunk(chunk), corrected)
+            CACHE_HITS.labels("grammar", "sentence").inc()
+            return corrected
+
+        CACHE_MISSES.labels("grammar").inc()
+        return None
+
+    def store(self, chunk: str, corrected: str):
+        if not chunk.strip():
+            return
+        self.chunks.put(normalize_chunk(chunk), corrected)
+
+        sentences = split_sentences(chunk)
+        corrected_sentences = split_sentences(corrected)
+        if len(sentences) == len(corrected_sentences):
+            for sentence, corrected_sentence in zip(sentences, corrected_sentences):
+                self.sentences.put(normalize_chunk(sentence), corrected_sentence)
+
+    def split_hits(self, chunks: list):
+        """
+        Returns (corrections, missing): cached corrections in chunk order (None where
+        missing) and the indices of the chunks that still have to be generated.
+        """
+        corrections = [self.lookup(chunk) for chunk in chunks]
+        missing = [i for i, corrected in enumerate(corrections) if corrected is None]
+        return corrections, missing
+
+
+correction_cache = CorrectionCache()
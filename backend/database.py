@@ -0,0 +1,226 @@
+import asyncio
+import base64
+import json
+import os
+import re
+from datetime import datetime
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DESCENDING
+from pymongo.server_api import ServerApi
+
+from metrics import stage_timer
+from write_behind import WriteBehindQueue
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGODB_URI")
+DB_NAME = os.getenv("MONGODB_DB_NAME", "essay")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+# "direct": session documents are written before /process_essay responds
+# "write_behind": they are queued and written in batches in the background
+MONGO_WRITE_MODE = os.getenv("MONGO_WRITE_MODE", "direct")
+MONGO_WRITE_QUEUE_SIZE = int(os.getenv("MONGO_WRITE_QUEUE_SIZE", "10000"))
+MONGO_WRITE_BATCH_SIZE = int(os.getenv("MONGO_WRITE_BATCH_SIZE", "100"))
+MONGO_WRITE_FLUSH_MS = float(os.getenv("MONGO_WRITE_FLUSH_MS", "50"))
+# How long shutdown waits for the write-behind queue to drain before dropping the rest
+MONGO_WRITE_CLOSE_TIMEOUT_SECONDS = float(os.getenv("MONGO_WRITE_CLOSE_TIMEOUT_SECONDS", "30"))
+# Page size of GET /sessions, and the largest page a client may ask for
+SESSIONS_PAGE_SIZE = int(os.getenv("SESSIONS_PAGE_SIZE", "50"))
+SESSIONS_MAX_PAGE_SIZE = int(os.getenv("SESSIONS_MAX_PAGE_SIZE", "200"))
+
+# One document per session; "feedback", "statistics" and "annotations" hold sessions
+# written before the migration (python migrate_sessions.py) and are still read
+SESSIONS_COLLECTION = "sessions"
+LEGACY_COLLECTIONS = ("feedback", "statistics", "annotations")
+
+# Only these fields are read for the session list; answers and LLM responses stay on disk
+SESSION_LIST_PROJECTION = {"session_id": 1, "question": 1, "created_at": 1}
+
+
+def create_mongo_client() -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(
+        MONGO_URI,
+        server_api=ServerApi('1'),
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+    )
+
+
+async def ensure_indexes(db):
+    """
+    Create the indexes the session endpoints rely on. create_index is a no-op when
+    the index already exists, so this runs on every startup.
+    """
+    await db[SESSIONS_COLLECTION].create_index("session_id", unique=True)
+    for name in LEGACY_COLLECTIONS:
+        await db[name].create_index("session_id")
+    # Newest-first keyset pagination of /sessions: (created_at, _id) is the sort order and the cursor
+    for name in (SESSIONS_COLLECTION, "feedback"):
+        await db[name].create_index([("created_at", DESCENDING), ("_id", DESCENDING)])
+
+
+def session_document(session_id: str, question: str, answer: str, feedback: dict, statistics: dict,
+                     edits: list, created_at: datetime) -> dict:
+    """
+    The single document stored per session. The essay is stored once; the annotated
+    HTML is re-rendered from `edits` on read.
+    """
+    return {
+        "session_id": session_id,
+        "question":   question,
+        "answer":     answer,
+        "feedback":   feedback,
+        "statistics": statistics,
+        "edits":      edits,
+        "created_at": created_at,
+    }
+
+
+def session_from_legacy(feedback_doc: dict, stats_doc: dict, anno_doc: dict) -> dict:
+    """
+    Session document assembled from the three legacy documents of one session.
+    """
+    doc = session_document(
+        feedback_doc["session_id"],
+        feedback_doc["question"],
+        feedback_doc["answer"],
+        feedback_doc["response"],
+        stats_doc["statistics"],
+        anno_doc.get("edits"),
+        feedback_doc["created_at"],
+    )
+    # Older sessions stored the rendered HTML instead of the edit list
+    if "annotated_essay" in anno_doc:
+        doc["annotated_essay"] = anno_doc["annotated_essay"]
+    return doc
+
+
+async def find_session(db, session_id: str):
+    """
+    Read a session in one round trip: from the sessions collection, or for sessions
+    not migrated yet, one $lookup aggregation over the legacy collections.
+    Returns None when the session does not exist or its legacy documents are incomplete.
+    """
+    doc = await db[SESSIONS_COLLECTION].find_one({"session_id": session_id})
+    if doc is not None:
+        return doc
+
+    legacy = await db["feedback"].aggregate([
+        {"$match": {"session_id": session_id}},
+        {"$limit": 1},
+        {"$lookup": {"from": "statistics", "localField": "session_id", "foreignField": "session_id", "as": "statistics_docs"}},
+        {"$lookup": {"from": "annotations", "localField": "session_id", "foreignField": "session_id", "as": "annotation_docs"}},
+    ]).to_list(1)
+    if not legacy or not legacy[0]["statistics_docs"] or not legacy[0]["annotation_docs"]:
+        return None
+    return session_from_legacy(legacy[0], legacy[0]["statistics_docs"][0], legacy[0]["annotation_docs"][0])
+
+
+def encode_cursor(doc: dict) -> str:
+    position = {"created_at": doc["created_at"].isoformat(), "id": str(doc["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    """
+    Returns the (created_at, _id) position encoded by encode_cursor; raises ValueError if it is malformed.
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(position["created_at"]), ObjectId(position["id"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def session_list_filter(cursor: str = None, question: str = None, created_after: datetime = None,
+                        created_before: datetime = None) -> dict:
+    """
+    MongoDB filter for one page of the newest-first session list.
+
+    The cursor is the position of the last session of the previous page; the page
+    starts right after it in (created_at, _id) order, so every page is an index range
+    scan no matter how deep it is. `question` matches case-insensitively anywhere in
+    the question; it is checked while walking the created_at index, so a rare match
+    scans further than an unfiltered page.
+    """
+    clauses = []
+    if question:
+        clauses.append({"question": {"$regex": re.escape(question), "$options": "i"}})
+    created_at = {}
+    if created_after is not None:
+        created_at["$gte"] = created_after
+    if created_before is not None:
+        created_at["$lt"] = created_before
+    if created_at:
+        clauses.append({"created_at": created_at})
+    if cursor:
+        last_created_at, last_id = decode_cursor(cursor)
+        clauses.append({"$or": [
+            {"created_at": {"$lt": last_created_at}},
+            {"created_at": last_created_at, "_id": {"$lt": last_id}},
+        ]})
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+async def list_sessions_page(db, limit: int = SESSIONS_PAGE_SIZE, cursor: str = None, question: str = None,
+                             created_after: datetime = None, created_before: datetime = None):
+    """
+    One page of sessions, newest first. Returns (docs, next_cursor); next_cursor is
+    None on the last page.
+
+    Sessions not migrated yet are listed from the legacy feedback collection. Both
+    collections are read with the same filter and merged, which is correct because
+    the migration moves a session instead of copying it.
+    """
+    query = session_list_filter(cursor, question, created_after, created_before)
+    sort = [("created_at", DESCENDING), ("_id", DESCENDING)]
+    # One extra document tells whether another page follows
+    pages = await asyncio.gather(*(
+        db[name].find(query, SESSION_LIST_PROJECTION).sort(sort).limit(limit + 1).to_list(limit + 1)
+        for name in (SESSIONS_COLLECTION, "feedback")
+    ))
+    docs = sorted(pages[0] + pages[1], key=lambda d: (d["created_at"], d["_id"]), reverse=True)[:limit + 1]
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+
+class SessionWriter:
+    """
+    Writes session documents in MONGO_WRITE_MODE: insert() awaits the insert_one
+    ("direct"), or only queues the document on a WriteBehindQueue ("write_behind").
+    """
+
+    def __init__(self, db, mode: str = MONGO_WRITE_MODE):
+        if mode not in ("direct", "write_behind"):
+            raise ValueError(f"MONGO_WRITE_MODE must be 'direct' or 'write_behind', got {mode!r}")
+        self.db = db
+        self.mode = mode
+        self.queue = None
+        if mode == "write_behind":
+            self.queue = WriteBehindQueue(
+                db,
+                max_size=MONGO_WRITE_QUEUE_SIZE,
+                batch_size=MONGO_WRITE_BATCH_SIZE,
+                flush_interval_ms=MONGO_WRITE_FLUSH_MS,
+            )
+
+    def start(self):
+        if self.queue is not None:
+            self.queue.start()
+
+    async def insert(self, collection: str, doc: dict):
+        if self.queue is not None:
+            await self.queue.enqueue(collection, doc)
+            return
+        with stage_timer(f"mongo_insert_{collection}"):
+            await self.db[collection].insert_one(doc)
+
+    async def close(self):
+        if self.queue is not None:
+            await self.queue.close(MONGO_WRITE_CLOSE_TIMEOUT_SECONDS)
@@ -0,0 +1,31 @@
+"""
+Download the pinned model repos into MODEL_DIR so the API can start without network access.
+
+Usage:
+    python download_models.py
+
+Revisions come from BERT_MODEL_REVISION and COEDIT_MODEL_REVISION (default "main").
+Afterwards, run the API with MODELS_OFFLINE=true.
+"""
+from huggingface_hub import snapshot_download
+
+from model_registry import BERT_REPO_ID, COEDIT_REPO_ID, HF_TOKEN, MODEL_REVISIONS, local_repo_dir
+
+# Only what the API loads; skips duplicate weight formats (TF/Flax/ONNX) in the repos
+ALLOW_PATTERNS = ["*.json", "*.txt", "*.model", "*.pkl", "*.bin", "*.safetensors"]
+
+
+def main():
+    for repo_id in (BERT_REPO_ID, COEDIT_REPO_ID):
+        path = snapshot_download(
+            repo_id=repo_id,
+            revision=MODEL_REVISIONS[repo_id],
+            local_dir=local_repo_dir(repo_id),
+            allow_patterns=ALLOW_PATTERNS,
+            token=HF_TOKEN,
+        )
+        print(f"{repo_id}@{MODEL_REVISIONS[repo_id]} -> {path}")
+
+
+if __name__ == "__main__":
+    main()
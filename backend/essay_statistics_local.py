@@ -0,0 +1,234 @@
+import re
+from collections import Counter
+
+# Local, deterministic version of the Gemini essay statistics (see get_essay_statistics.py).
+# Pure Python: regex tokenizer, stopword list, rule-based lemmatizer, closed-class
+# filtering of content words and a token trie for multi-word cohesive devices.
+
+WORD_PATTERN = re.compile(r"[A-Za-z]+(?:['’][A-Za-z]+)*")
+SENTENCE_PATTERN = re.compile(r"[^.!?]+[.!?]*")
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are aren't as at be because been before being
+below between both but by can can't cannot could couldn't did didn't do does doesn't doing don't down
+during each few for from further had hadn't has hasn't have haven't having he he'd he'll he's her here
+here's hers herself him himself his how how's i i'd i'll i'm i've if in into is isn't it it's its itself
+let's me more most mustn't my myself no nor not of off on once only or other ought our ours ourselves
+out over own same shan't she she'd she'll she's should shouldn't so some such than that that's the their
+theirs them themselves then there there's these they they'd they'll they're they've this those through
+to too under until up very was wasn't we we'd we'll we're we've were weren't what what's when when's
+where where's which while who who's whom why why's with won't would wouldn't you you'd you'll you're
+you've your yours yourself yourselves
+""".split())
+
+# Closed-class words (auxiliaries, modals, quantifiers, generic verbs/nouns) that are not
+# stopwords above but are never lexical repetition worth reporting
+FUNCTION_WORDS = frozenset("""
+also although always among another anyone anything around away become becomes became can could
+either else even ever every everyone everything get gets got getting however instead just like
+likely make makes made many may might much must neither never nevertheless none nothing now often
+one ones onto per perhaps quite rather really since something still thing things though thus together
+toward towards upon us whether will within without yet
+""".split())
+
+# Irregular forms whose lemma cannot be found by suffix rules
+IRREGULAR_LEMMAS = {
+    "am": "be", "is": "be", "are": "be", "was": "be", "were": "be", "been": "be", "being": "be",
+    "has": "have", "had": "have", "does": "do", "did": "do", "done": "do",
+    "went": "go", "gone": "go", "goes": "go", "made": "make", "said": "say", "took": "take", "taken": "take",
+    "gave": "give", "given": "give", "got": "get", "gotten": "get", "came": "come", "saw": "see", "seen": "see",
+    "knew": "know", "known": "know", "thought": "think", "brought": "bring", "bought": "buy", "taught": "teach",
+    "found": "find", "felt": "feel", "kept": "keep", "left": "leave", "meant": "mean", "spent": "spend",
+    "children": "child", "people": "people", "men": "man", "women": "woman", "lives": "life", "wives": "wife",
+    "better": "good", "best": "good", "worse": "bad", "worst": "bad", "data": "data", "media": "media",
+    # Words ending in -s or -ies that are not plurals
+    "news": "news", "series": "series", "species": "species", "politics": "politics",
+    "economics": "economics", "physics": "physics", "mathematics": "mathematics", "crisis": "crisis",
+}
+
+# Nouns and adjectives ending in -ing/-ed that are not inflected verbs; stripping the
+# suffix would merge them with an unrelated word ("evening" -> "even") or a non-word ("ceil")
+NOT_INFLECTED = frozenset("""
+evening morning ceiling wedding pudding sibling darling shilling herring awning offspring
+hundred sacred naked wicked kindred rugged ragged jagged crooked beloved
+""".split())
+
+# Common essay verbs whose base form ends in a silent "e" that -ed/-ing removes, for stems
+# the orthographic rules in restore_final_e() cannot decide ("stated", "hoped", "produced"...)
+E_FINAL_VERBS = frozenset("""
+achieve agree argue arrive believe care cause change choose close combine compare compete complete
+continue create damage decide decline decrease define describe determine encourage engage ensure
+escape exercise experience face force hate hope improve include increase introduce involve judge
+live lose manage measure move note oppose prepare produce promote provide purchase raise realise
+realize receive reduce release remove replace require reserve resolve retire save serve share shape
+solve state store suppose survive taste trade use value vote waste
+""".split())
+
+# Cohesive devices (linking words and phrases); multi-word entries are matched as token sequences
+COHESIVE_DEVICES = (
+    "however", "therefore", "moreover", "furthermore", "in addition", "additionally", "besides",
+    "nevertheless", "nonetheless", "consequently", "as a result", "thus", "hence", "accordingly",
+    "on the other hand", "on the contrary", "in contrast", "by contrast", "conversely", "whereas",
+    "while", "although", "even though", "though", "despite", "in spite of", "yet", "instead",
+    "for example", "for instance", "such as", "namely", "in particular", "particularly", "specifically",
+    "firstly", "secondly", "thirdly", "first of all", "finally", "lastly", "meanwhile", "subsequently",
+    "in conclusion", "to conclude", "to sum up", "in summary", "overall", "all in all", "in short",
+    "in other words", "that is to say", "similarly", "likewise", "in the same way", "as well as",
+    "because", "since", "due to", "owing to", "so that", "in order to", "as long as", "unless",
+    "indeed", "in fact", "of course", "clearly", "obviously", "admittedly", "undoubtedly",
+    "to begin with", "not only", "but also", "apart from", "with regard to", "regarding", "in terms of",
+)
+
+
+def tokenize(text: str) -> list:
+    return [match.group(0).lower().replace("’", "'") for match in WORD_PATTERN.finditer(text)]
+
+
+def restore_final_e(stem: str, vocabulary=frozenset()) -> str:
+    """
+    Base form of a verb stem left by removing -ed/-ing: "increas" -> "increase",
+    "work" -> "work". The essay's own words decide first ("increase" or "increases"
+    used elsewhere), then the E_FINAL_VERBS lexicon, then spelling: English words do
+    not end in "v", and rarely in "c", "z", "dg", "rg" or a vowel followed by "s".
+    """
+    if stem + "e" in vocabulary or stem + "es" in vocabulary or stem + "e" in E_FINAL_VERBS:
+        return stem + "e"
+    if stem in vocabulary:
+        return stem
+    if (stem.endswith(("v", "z", "dg", "rg", "ang", "eng"))
+            or (stem.endswith("c") and not stem.endswith("ck"))
+            or re.search(r"[aeio]s$", stem)):
+        return stem + "e"
+    return stem
+
+
+def lemmatize(word: str, vocabulary=frozenset()) -> str:
+    """
+    Rule-based lemma: irregular forms first, then plural and verb-suffix stripping.
+    Good enough to merge "technology"/"technologies" or "increase"/"increasing" when
+    counting repetition. `vocabulary` (the essay's words) helps restore a dropped "e".
+    Words in NOT_INFLECTED keep their -ing/-ed.
+
+    >>> [lemmatize(w) for w in ("evening", "morning", "hundred", "increasing", "running", "studied")]
+    ['evening', 'morning', 'hundred', 'increase', 'run', 'study']
+    """
+    if word in IRREGULAR_LEMMAS:
+        return IRREGULAR_LEMMAS[word]
+    if len(word) <= 3 or word in NOT_INFLECTED:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("sses", "shes", "ches", "xes", "zes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    for suffix in ("ing", "ed"):
+        stem = word[:-len(suffix)]
+        # need, feed and bring, thing are not inflected forms
+        if not word.endswith(suffix) or word.endswith("eed") or len(stem) < 2 or not re.search(r"[aeiouy]", stem):
+            continue
+        if len(stem) >= 3 and stem[-1] == stem[-2] and stem[-1] not in "lsz":
+            return stem[:-1]  # running -> run
+        if stem.endswith("i"):
+            return stem[:-1] + "y"  # studied -> study
+        if len(stem) <= 3 and stem[-1] not in "aeiouwxy" and stem[-2] in "aeiou":
+            return stem + "e"  # making -> make, used -> use
+        return restore_final_e(stem, vocabulary)
+    return word
+
+
+def is_content_word(word: str) -> bool:
+    # Without a POS tagger, content words are the open-class words: everything that is not a
+    # stopword, closed-class word, contraction or very short token
+    return len(word) > 2 and "'" not in word and word not in STOPWORDS and word not in FUNCTION_WORDS
+
+
+class PhraseTrie:
+    """
+    Token trie over the cohesive-device lexicon. match() scans a token list once and
+    returns the leftmost-longest, non-overlapping phrase matches.
+    """
+
+    def __init__(self, phrases):
+        self.root = {}
+        self.max_length = 0
+        for phrase in phrases:
+            tokens = phrase.split()
+            node = self.root
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node[None] = phrase
+            self.max_length = max(self.max_length, len(tokens))
+
+    def match(self, tokens: list) -> list:
+        matches = []
+        i = 0
+        while i < len(tokens):
+            node = self.root
+            longest = None
+            for j in range(i, min(i + self.max_length, len(tokens))):
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                if None in node:
+                    longest = (node[None], j + 1)
+            if longest is not None:
+                matches.append(longest[0])
+                i = longest[1]
+            else:
+                i += 1
+        return matches
+
+
+cohesive_trie = PhraseTrie(COHESIVE_DEVICES)
+
+
+def analyze_essay(essay: str, top_n: int = 5) -> dict:
+    """
+    Essay statistics in the same JSON shape as the Gemini prompt
+    (top_repeated_content_words, coherence_word_count), plus word, sentence and
+    lexical diversity counts.
+    """
+    tokens = tokenize(essay)
+    vocabulary = frozenset(tokens)
+    lemmas = [lemmatize(token, vocabulary) for token in tokens]
+    content_pairs = [(token, lemma) for token, lemma in zip(tokens, lemmas) if is_content_word(token) and is_content_word(lemma)]
+    content = [lemma for _, lemma in content_pairs]
+
+    # Each lemma is reported as its most frequent spelling in the essay (the base form on a
+    # tie), so the user always sees a word they wrote rather than a lemma
+    surface_forms = {}
+    for token, lemma in content_pairs:
+        surface_forms.setdefault(lemma, Counter())[token] += 1
+
+    # Counter keeps first-seen order among equal counts, so ties are broken by first appearance
+    content_counts = Counter(content)
+    top_words = [
+        {"word": max(surface_forms[lemma].items(), key=lambda item: (item[1], item[0] == lemma))[0], "count": count}
+        for lemma, count in content_counts.most_common(top_n)
+        if count > 1
+    ]
+
+    cohesive_counts = Counter(cohesive_trie.match(tokens))
+
+    sentence_lengths = [len(tokenize(sentence)) for sentence in SENTENCE_PATTERN.findall(essay)]
+    sentence_lengths = [length for length in sentence_lengths if length]
+
+    return {
+        "top_repeated_content_words": top_words,
+        "coherence_word_count": sum(cohesive_counts.values()),
+        "coherence_words": [{"word": phrase, "count": count} for phrase, count in cohesive_counts.most_common()],
+        "word_count": len(tokens),
+        "unique_word_count": len(set(lemmas)),
+        "type_token_ratio": round(len(set(lemmas)) / len(tokens), 3) if tokens else 0.0,
+        "lexical_density": round(len(content) / len(tokens), 3) if tokens else 0.0,
+        "sentence_count": len(sentence_lengths),
+        "sentence_length": {
+            "mean": round(sum(sentence_lengths) / len(sentence_lengths), 1) if sentence_lengths else 0.0,
+            "min": min(sentence_lengths, default=0),
+            "max": max(sentence_lengths, default=0),
+            "short": sum(1 for length in sentence_lengths if length < 10),
+            "medium": sum(1 for length in sentence_lengths if 10 <= length <= 25),
+            "long": sum(1 for length in sentence_lengths if length > 25),
+        },
+    }
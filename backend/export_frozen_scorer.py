@@ -0,0 +1,31 @@
+"""
+Export the inference-optimized BERT scorer as a frozen TorchScript artifact.
+
+Usage:
+    python export_frozen_scorer.py [--output artifacts/bert_scorer_frozen.pt]
+
+The StandardScaler and the BatchNorm on the word count are folded into fc0, and the
+scoring head is traced and frozen together with BERT. Serve the result with
+BERT_BACKEND=frozen, which loads this file instead of building BERTWithExtraFeature.
+"""
+import argparse
+import os
+
+from BERTWithExtraFeature import export_frozen_scorer
+import bert_setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=bert_setup.BERT_FROZEN_PATH)
+    args = parser.parse_args()
+
+    loaded = bert_setup.get_bert()
+    model = loaded.model if loaded.model is not None else bert_setup.load_training_model()
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    export_frozen_scorer(model, loaded.scaler, args.output)
+    print(f"Saved frozen BERT scorer to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
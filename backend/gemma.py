@@ -1,4 +1,4 @@
-from bert_setup import get_overall_score
+from bert_setup import SCORE_MODEL_VERSION, score_essay
 import asyncio
 import httpx
 import asyncio
@@ -6,19 +6,23 @@ from dotenv import load_dotenv
 import os
 import json
 import httpx
-from google import genai
+from google.genai import errors as genai_errors
 from handle_json import read_json_from_string
+from metrics import JSON_PARSES, count_gemini_tokens, stage_timer
+from llm_cache import llm_cache, llm_cache_key
+from llm_dispatch import CircuitOpenError
+from ollama_stream import stream_ollama_chat
 load_dotenv()
 OLLAMA_URL = os.getenv("OLLAMA_URL")
 print(OLLAMA_URL)
 OLLAMA_HEALTH_ENDPOINT = f"{OLLAMA_URL}/"
 OLLAMA_CHAT_ENDPOINT = f"{OLLAMA_URL}/api/chat"
 print('OLLAMA_CHAT_ENDPOINT', OLLAMA_CHAT_ENDPOINT)
-RETRY_DELAY = int(os.getenv("RETRY_DELAY"))
-MAX_RETRIES = int(os.getenv("MAX_RETRIES"))
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_API_KEY_2 = os.getenv("GEMINI_API_KEY_2")
-BAND_DISCRIPTIOR_FILE = os.getenv("BAND_DISCRIPTIOR_FILE")
+# Bump when the prompts or the post-processing change, so cached feedback is not reused
+FEEDBACK_PROMPT_VERSION = "1"
+# The BERT scorer is part of the key: the cached feedback embeds its band score and both
+# prompts are written for that score
+FEEDBACK_MODELS = ("gemma-3-essay", "models/gemini-2.0-flash-001", SCORE_MODEL_VERSION)
 print('GEMMA file load successfully')
 async def create_evaluation_prompt(question: str, essay: str, overall_score: float) -> str:
     prompt = (
@@ -115,7 +119,7 @@ async def create_constructive_feedback_prompt(question: str, essay: str, overall
 
 
 
-async def get_evaluation_feedback(user_id: str, overall_score: float, question: str , answer: str, client) -> str:
+async def get_evaluation_feedback(user_id: str, overall_score: float, question: str , answer: str, clients) -> str:
     evaluation_prompt = await create_evaluation_prompt(question, answer, overall_score)
     
     payload = {
@@ -129,25 +133,25 @@ async def get_evaluation_feedback(user_id: str, overall_score: float, question:
         }
     }
 
-    timeout = httpx.Timeout(180.0, connect=10.0)
     try:
-        async with httpx.AsyncClient(timeout=timeout) as http_client:
-            response = await http_client.post(OLLAMA_CHAT_ENDPOINT, json=payload)
-            response.raise_for_status()
-
-            # Ghép nội dung trả về dạng JSON line (stream)
-            evaluation_text = ""
-            for line in response.text.splitlines():
-                try:
-                    data = json.loads(line)
-                    evaluation_text += data["message"]["content"]
-                except Exception:
-                    continue
-
-    except httpx.HTTPError as e:
+        # Pooled client owned by the app lifespan (see clients.py); timeouts and limits are set there.
+        # Chunks are consumed as they arrive, and the stream is closed once the JSON object is complete.
+        # Retries and the circuit breaker live in the dispatcher (see llm_dispatch.py)
+        with stage_timer("ollama_evaluation"):
+            evaluation_text, stream_stats = await clients.ollama_dispatch.call(
+                lambda: stream_ollama_chat(clients.ollama, OLLAMA_CHAT_ENDPOINT, payload), operation="evaluation"
+            )
+        print(f"Ollama evaluation: {stream_stats}")
+    except (httpx.HTTPError, CircuitOpenError) as e:
         print(f"Error calling Ollama: {e}")
         return "Failed to get feedback from Ollama."
 
+    # Local repair handles the usual LLM JSON mistakes; Gemini is only asked when it fails
+    local = read_json_from_string(evaluation_text)
+    if local["valid_json"]:
+        JSON_PARSES.labels("evaluation", "local_fixed" if local["repaired"] else "clean").inc()
+        return json.dumps(local["parsed"], ensure_ascii=False)
+
     gemini_prompt = (
         f"You are a strict JSON fixer and formatter.\n"
         f"Your task is to take the following possibly malformed JSON and output a strictly valid, properly formatted JSON object—nothing else.\n\n"
@@ -163,57 +167,77 @@ async def get_evaluation_feedback(user_id: str, overall_score: float, question:
         f"- The result must be parseable by JSON.parse() without errors.\n"
     )
 
-    def run_gemini():
-        return client.models.generate_content(
+    def run_gemini(client, key_name):
+        response = client.models.generate_content(
             model="models/gemini-2.0-flash-001",
             contents=gemini_prompt
         )
+        count_gemini_tokens("models/gemini-2.0-flash-001", response)
+        return response
 
-    gemini_response = await asyncio.to_thread(run_gemini)
+    with stage_timer("gemini_json_fix"):
+        gemini_response = await clients.gemini_pool.generate(run_gemini, operation="json_fix")
     corrected_json = gemini_response.text
+    JSON_PARSES.labels("evaluation", "llm_fixed" if read_json_from_string(corrected_json)["valid_json"] else "failed").inc()
     return corrected_json
 
 
 import time  # Import the time module to measure execution time
 
-async def get_constructive_feedback(user_id: str, overall_score: float, question: str , answer: str, client, band_descriptors) -> str:
+async def get_constructive_feedback(user_id: str, overall_score: float, question: str , answer: str, clients) -> str:
     constructive_prompt = await create_constructive_feedback_prompt(question, answer, overall_score)
 
-    def run_gemini():
+    def run_gemini(client, key_name):
+        # The band descriptor file must be uploaded with the same key that uses it
+        band_descriptors = clients.band_descriptors[key_name]
         start_time = time.time()  # Start the timer
-        result = client.models.generate_content(
-            model="models/gemini-2.0-flash-001",
-            contents=[band_descriptors, constructive_prompt]
-        )
+        try:
+            result = client.models.generate_content(
+                model="models/gemini-2.0-flash-001",
+                **band_descriptors.generate_content_kwargs(constructive_prompt)
+            )
+        except genai_errors.ClientError as e:
+            if e.code not in (403, 404):
+                raise
+            # The uploaded file or context cache is gone on the server: upload again and retry once
+            band_descriptors.invalidate()
+            result = client.models.generate_content(
+                model="models/gemini-2.0-flash-001",
+                **band_descriptors.generate_content_kwargs(constructive_prompt)
+            )
         end_time = time.time()  # End the timer
         print(f"run_gemini execution time: {end_time - start_time:.2f} seconds")  # Log the execution time
+        count_gemini_tokens("models/gemini-2.0-flash-001", result)
         return result
 
-    constructive_response = await asyncio.to_thread(run_gemini)
+    with stage_timer("gemini_constructive"):
+        constructive_response = await clients.gemini_pool.generate(run_gemini, operation="constructive")
     constructive_text = constructive_response.text
     return constructive_text
 
-async def get_feedback(question: str, answer: str) -> dict:
+async def get_feedback(question: str, answer: str, clients) -> dict:
     """
     Compute overall score and return merged evaluation + constructive feedback.
+    `clients` is the app's clients.LLMClients.
+    Results are cached, and identical concurrent requests share one computation.
     """
+    key = llm_cache_key("feedback", FEEDBACK_PROMPT_VERSION, FEEDBACK_MODELS, question, answer)
+    return await llm_cache.get_or_compute(key, lambda: _compute_feedback(question, answer, clients))
+
+async def _compute_feedback(question: str, answer: str, clients) -> dict:
     # 1. Compute IELTS score
-    overall_score = float(get_overall_score(question, answer))
+    overall_score = float(await score_essay(question, answer))
     user_id = "test_user_id"  # Replace with actual user ID
 
-    # 2. Initialize clients
-    client = genai.Client(api_key=GEMINI_API_KEY)
-    client_2 = genai.Client(api_key=GEMINI_API_KEY_2)
-    band_descriptors = client.files.upload(file=BAND_DISCRIPTIOR_FILE)
-
-    evaluation_task = get_evaluation_feedback(user_id, overall_score, question, answer, client_2)
-    constructive_task = get_constructive_feedback(user_id, overall_score, question, answer, client, band_descriptors)
+    # 2. Long-lived clients; Gemini calls are spread over the key pool
+    evaluation_task = get_evaluation_feedback(user_id, overall_score, question, answer, clients)
+    constructive_task = get_constructive_feedback(user_id, overall_score, question, answer, clients)
 
     evaluation_text, constructive_text = await asyncio.gather(evaluation_task, constructive_task)
 
     # 5. Parse and merge
     eval_res = read_json_from_string(evaluation_text)
-    const_res = read_json_from_string(constructive_text)
+    const_res = read_json_from_string(constructive_text, source="constructive")
 
     if not eval_res["valid_json"]:
         raise ValueError(f"Evaluation JSON parse error: {eval_res['error']}")
@@ -1,9 +1,16 @@
-import asyncio
-from handle_json import read_json_from_string
 import os
-from google import genai
+from handle_json import read_json_from_string
+from llm_cache import llm_cache, llm_cache_key
+from essay_statistics_local import analyze_essay
+from metrics import count_gemini_tokens, stage_timer
 
-GEMINI_API_KEY_3 = os.getenv("GEMINI_API_KEY_3")
+# "local": deterministic statistics computed in-process (essay_statistics_local.py)
+# "gemini": ask Gemini with the prompt below
+ESSAY_STATISTICS_ENGINE = os.getenv("ESSAY_STATISTICS_ENGINE", "local")
+
+# Bump when the prompt changes, so cached statistics are not reused
+STATISTICS_PROMPT_VERSION = "1"
+STATISTICS_MODEL = "models/gemini-2.0-flash-001"
 async def create_prompt_for_essay_analysis(essay: str) -> str:
     prompt = (
         "You are an AI assistant that analyzes English essays for writing quality.\n"
@@ -29,21 +36,32 @@ async def create_prompt_for_essay_analysis(essay: str) -> str:
     )
     return prompt
 
-async def get_essay_statistics(essay: str) -> dict:
-    client = genai.Client(api_key=GEMINI_API_KEY_3)
+async def get_essay_statistics(essay: str, gemini_pool) -> dict:
+    # `gemini_pool` is the app's llm_dispatch.GeminiKeyPool (see clients.py).
+    # Results are cached, and identical concurrent requests share one Gemini call.
+    if ESSAY_STATISTICS_ENGINE == "local":
+        with stage_timer("local_statistics"):
+            return analyze_essay(essay)
+    key = llm_cache_key("statistics", STATISTICS_PROMPT_VERSION, [STATISTICS_MODEL], essay)
+    return await llm_cache.get_or_compute(key, lambda: _compute_essay_statistics(essay, gemini_pool))
+
+async def _compute_essay_statistics(essay: str, gemini_pool) -> dict:
     prompt = await create_prompt_for_essay_analysis(essay)
 
-    def run_gemini():
-        return client.models.generate_content(
-            model="models/gemini-2.0-flash-001",
+    def run_gemini(client, key_name):
+        response = client.models.generate_content(
+            model=STATISTICS_MODEL,
             contents=[prompt]
         )
+        count_gemini_tokens(STATISTICS_MODEL, response)
+        return response
 
-    response = await asyncio.to_thread(run_gemini)
+    with stage_timer("gemini_statistics"):
+        response = await gemini_pool.generate(run_gemini, operation="statistics")
 
     statistics_text = response.text
 
-    stat_res = read_json_from_string(statistics_text)
+    stat_res = read_json_from_string(statistics_text, source="statistics")
 
     if not stat_res["valid_json"]:
         raise ValueError(f"Evaluation JSON parse error: {stat_res['error']}")
@@ -1,132 +1,270 @@
 import asyncio
+import bisect
 import difflib
+import html
 import json
-import pandas as pd
+import os
 import re
+import time
 import torch
-from transformers import AutoTokenizer, T5ForConditionalGeneration
-# initialize the model and tokenizer
-tokenizer = None
-model = None
-tokenizer = None
-model = None
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-tokenizer = AutoTokenizer.from_pretrained("grammarly/coedit-large")
-model = T5ForConditionalGeneration.from_pretrained("grammarly/coedit-large").to(device)
-print(f"COEDIT Model and tokenizer loaded. Running on device: {device}")
-    
+from types import SimpleNamespace
+from transformers import AutoTokenizer
+from inference_executor import get_inference_executor
+from micro_batcher import MicroBatcher
+from correction_cache import correction_cache, normalize_chunk
+from coedit_decoding import generation_kwargs, get_decoding_profile
+from metrics import observe_coedit_chunks, stage_timer, track_batcher
+from grammar_backends import load_grammar_backend
+from model_registry import COEDIT_REPO_ID, LazyModel, pretrained_kwargs, resolve_repo, timed_phase
+
+# Inference backend: "eager" (fp32 PyTorch), "int8" (dynamic quantization) or "onnx"
+# (ONNX Runtime encoder/decoder with cached past key values, exported to COEDIT_ONNX_DIR).
+# Use grammar_parity.py to compare a backend's edits with the eager model before switching.
+COEDIT_BACKEND = os.getenv("COEDIT_BACKEND", "eager")
+COEDIT_ONNX_DIR = os.getenv("COEDIT_ONNX_DIR", "artifacts/coedit_onnx")
+
+def _load_coedit_tokenizer(phases):
+    return AutoTokenizer.from_pretrained(resolve_repo(COEDIT_REPO_ID), **pretrained_kwargs(COEDIT_REPO_ID))
+
+# Loaded separately so chunking never needs the model in the API process (e.g. with COEDIT_EXECUTOR=process)
+coedit_tokenizer = LazyModel("coedit-tokenizer", _load_coedit_tokenizer)
+
+def _load_coedit(phases):
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    with timed_phase(phases, "tokenizer"):
+        tokenizer = coedit_tokenizer.get()
+    with timed_phase(phases, "model"):
+        model, device = load_grammar_backend(
+            COEDIT_BACKEND, device, onnx_dir=COEDIT_ONNX_DIR,
+            intra_op_threads=int(os.getenv("COEDIT_TORCH_THREADS", "0"))
+        )
+    print(f"COEDIT Model and tokenizer loaded ({COEDIT_BACKEND} backend). Running on device: {device}")
+    return SimpleNamespace(tokenizer=tokenizer, model=model, device=device)
+
+coedit = LazyModel("coedit", _load_coedit)
+
+# Chunks per generate() call, and how long a chunk waits for chunks of other documents to join its batch
+COEDIT_MAX_BATCH_SIZE = int(os.getenv("COEDIT_MAX_BATCH_SIZE", "16"))
+COEDIT_BATCH_WINDOW_MS = float(os.getenv("COEDIT_BATCH_WINDOW_MS", "5"))
+COEDIT_CROSS_DOCUMENT_BATCHING = os.getenv("COEDIT_CROSS_DOCUMENT_BATCHING", "true").lower() == "true"
+
+def get_coedit():
+    """
+    The loaded CoEdIT tokenizer, model and device, loading them on first use.
+    """
+    return coedit.get()
+
 def fix_grammar(text: str, tokenizer, model, device) -> str:
-    prompt = "Fix grammar: " + text
-    inputs = tokenizer(prompt, return_tensors="pt", truncation=True).to(device)
-    outputs = model.generate(inputs.input_ids, max_length=64)
-    output_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    return output_text
+    return fix_grammar_batch([text], tokenizer, model, device)[0]
 
-def split_text_into_chunks(text: str, tokenizer, max_tokens: int = 64) -> list:
+def fix_grammar_batch(texts: list, tokenizer, model, device, batch_size: int = 16, profile: dict = None, return_stats: bool = False):
     """
-    Tách text thành các chunk nhỏ dựa theo câu, sao cho mỗi chunk không vượt quá max_tokens.
-    Sử dụng regex để tách câu dựa trên dấu kết thúc câu (., !, ?).
+    Batched fix_grammar: corrects many chunks with one padded generate() call per
+    `batch_size` chunks. Chunks are sorted by length first so each batch pads as little
+    as possible; results are returned in input order. Blank chunks are returned as-is.
+
+    Decoding follows `profile` (see coedit_decoding.DECODING_PROFILES). With
+    return_stats=True, it also returns one dict per chunk with input_tokens,
+    output_tokens, seconds (the chunk's share of its generate() call), batch_seconds
+    and batch_row (the whole call's latency, and the chunk's row in it), unchanged
+    and early_exit.
+    """
+    profile = profile or get_decoding_profile()
+    results = list(texts)
+    stats = [
+        {"input_tokens": 0, "output_tokens": 0, "seconds": 0.0, "batch_seconds": 0.0, "batch_row": None,
+         "unchanged": True, "early_exit": False}
+        for _ in texts
+    ]
+    order = sorted((i for i, text in enumerate(texts) if text.strip()), key=lambda i: len(texts[i]))
+    for start in range(0, len(order), batch_size):
+        batch_ids = order[start:start + batch_size]
+        prompts = ["Fix grammar: " + texts[i] for i in batch_ids]
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True, truncation=True).to(device)
+        target_ids = tokenizer([texts[i] for i in batch_ids], add_special_tokens=False)["input_ids"]
+        kwargs, early_exit = generation_kwargs(model, profile, inputs.input_ids.shape[1], target_ids=target_ids, device=device)
+
+        start_time = time.perf_counter()
+        with torch.no_grad():
+            outputs = model.generate(input_ids=inputs.input_ids, attention_mask=inputs.attention_mask, **kwargs)
+        elapsed = time.perf_counter() - start_time
+
+        input_lengths = inputs.attention_mask.sum(dim=1).tolist()
+        output_lengths = (outputs[:, 1:] != tokenizer.pad_token_id).sum(dim=1).tolist()
+        for row, (i, output_text) in enumerate(zip(batch_ids, tokenizer.batch_decode(outputs, skip_special_tokens=True))):
+            results[i] = output_text
+            stats[i] = {
+                "input_tokens": int(input_lengths[row]),
+                "output_tokens": int(output_lengths[row]),
+                # The batch latency divided across its rows, so a batch adds up to its real time
+                "seconds": round(elapsed / len(batch_ids), 4),
+                "batch_seconds": round(elapsed, 4),
+                "batch_row": row,
+                "unchanged": normalize_chunk(output_text) == normalize_chunk(texts[i]),
+                "early_exit": early_exit is not None and row in early_exit.exited,
+            }
+    if return_stats:
+        return results, stats
+    return results
+
+def _sentence_spans(text: str) -> list:
+    # (start, end) of each sentence; the whitespace after a sentence belongs to it, so the spans tile the text
+    spans = []
+    start = 0
+    for match in re.finditer(r'(?<=[.!?])\s+', text):
+        spans.append((start, match.end()))
+        start = match.end()
+    if start < len(text):
+        spans.append((start, len(text)))
+    return spans
+
+def pack_sentences(text: str, offsets: list, max_tokens: int = 64) -> list:
     """
-    # Tách theo các dấu kết thúc câu (bao gồm cả khoảng trắng phía sau)
-    sentences = re.split(r'(?<=[.!?])\s+', text)
+    Pack the sentences of `text` into chunks of at most max_tokens tokens, using the offset
+    mapping of a single tokenize call instead of re-tokenizing every candidate chunk.
+    Returns contiguous slices of `text` ("".join(chunks) == text). A sentence longer than
+    max_tokens is cut at word boundaries into pieces of at most max_tokens tokens.
+    """
+    starts = [start for start, end in offsets if end > start]
+    if len(starts) <= max_tokens:
+        return [text] if text else []
+
     chunks = []
-    current_chunk = ""
-    for sentence in sentences:
-        test_chunk = current_chunk + (" " if current_chunk else "") + sentence
-        tokens = tokenizer.tokenize(test_chunk)
-        if len(tokens) <= max_tokens:
-            current_chunk = test_chunk
+    chunk_start, chunk_tokens = 0, 0
+    for sentence_start, sentence_end in _sentence_spans(text):
+        first = bisect.bisect_left(starts, sentence_start)
+        last = bisect.bisect_left(starts, sentence_end)
+        sentence_tokens = last - first
+
+        if sentence_tokens > max_tokens:
+            # Close the current chunk, then cut the sentence itself
+            if sentence_start > chunk_start:
+                chunks.append(text[chunk_start:sentence_start])
+            piece_first = first
+            piece_start = sentence_start
+            while last - piece_first > max_tokens:
+                cut = piece_first + max_tokens
+                # Prefer cutting right before a token that starts a new word
+                word_cut = next((j for j in range(cut, piece_first, -1) if text[starts[j] - 1].isspace()), cut)
+                chunks.append(text[piece_start:starts[word_cut]])
+                piece_first, piece_start = word_cut, starts[word_cut]
+            chunk_start, chunk_tokens = piece_start, last - piece_first
+        elif chunk_tokens + sentence_tokens <= max_tokens:
+            chunk_tokens += sentence_tokens
         else:
-            if current_chunk:
-                chunks.append(current_chunk)
-            current_chunk = sentence
-    if current_chunk:
-        chunks.append(current_chunk)
+            chunks.append(text[chunk_start:sentence_start])
+            chunk_start, chunk_tokens = sentence_start, sentence_tokens
+
+    if chunk_start < len(text):
+        chunks.append(text[chunk_start:])
     return chunks
 
-def annotate_differences(original_text: str, corrected_text: str) -> str:
-    original_words = original_text.split()
+def split_text_into_chunks(text: str, tokenizer, max_tokens: int = 64) -> list:
+    """
+    Tách text thành các chunk nhỏ dựa theo câu, sao cho mỗi chunk không vượt quá max_tokens.
+    Text chỉ được tokenize một lần (có offset mapping) và các câu được gom theo số token
+    cộng dồn (xem pack_sentences), nên chi phí tuyến tính theo độ dài text.
+    """
+    encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+    return pack_sentences(text, encoding["offset_mapping"], max_tokens)
+
+def build_edits(original_text: str, corrected_text: str, base_offset: int = 0, base_word_index: int = 0) -> list:
+    """
+    Compare a chunk with its correction word by word and return the edits found, in one
+    pass over the difflib opcodes. Each edit is a dict with:
+      - start, end: character offsets of the original span (plus base_offset); an insert
+        has start == end, right after the preceding word
+      - original: the original span text ("" for an insert)
+      - suggestion: the replacement text ("" for a delete)
+      - type: "replace", "delete" or "insert"
+      - word_index: index of the first original word involved (plus base_word_index);
+        for an insert, the index of the word it goes before
+    """
     corrected_words = corrected_text.split()
+    original_positions = [match.span() for match in re.finditer(r'\S+', original_text)]
+    original_words = [original_text[start:end] for start, end in original_positions]
 
     seq_matcher = difflib.SequenceMatcher(None, original_words, corrected_words)
-    opcodes = seq_matcher.get_opcodes()
-
-    def get_word_positions(text: str):
-        positions = []
-        for match in re.finditer(r'\S+', text):
-            start, end = match.span()
-            positions.append((match.group(), start, end))
-        return positions
-
-    original_positions = get_word_positions(original_text)
-    annotated_text = ""
-    last_index = 0
-
-    for tag, i1, i2, j1, j2 in opcodes:
+    edits = []
+    for tag, i1, i2, j1, j2 in seq_matcher.get_opcodes():
         if tag == "equal":
-            if i1 < len(original_positions):
-                segment_start = original_positions[i1][1]
-                segment_end = original_positions[i2 - 1][2] if (i2 - 1) < len(original_positions) else len(original_text)
-                annotated_text += original_text[last_index:segment_start]
-                annotated_text += original_text[segment_start:segment_end]
-                last_index = segment_end
-        elif tag in ["replace", "delete"]:
-            if i1 < len(original_positions):
-                segment_start = original_positions[i1][1]
-                segment_end = original_positions[i2 - 1][2] if (i2 - 1) < len(original_positions) else len(original_text)
-                error_segment = original_text[segment_start:segment_end]
-                suggestion = " ".join(corrected_words[j1:j2])
-                annotated_text += original_text[last_index:segment_start]
-                annotated_text += (
-                    f"<span class='error-block' onclick='showSuggestion(this)' data-suggestion='{suggestion}'>{error_segment}</span>"
-                )
-                last_index = segment_end
-        elif tag == "insert":
-            suggestion = " ".join(corrected_words[j1:j2])
-            annotated_text += f"<span class='suggestion'>{suggestion}</span>"
-
-    annotated_text += original_text[last_index:]
-    return annotated_text
-
-
-def process_document(document_text: str, tokenizer, model, device, max_tokens: int = 64) -> str:    
+            continue
+        if tag in ("replace", "delete"):
+            start, end = original_positions[i1][0], original_positions[i2 - 1][1]
+        elif i1 > 0:
+            start = end = original_positions[i1 - 1][1]
+        else:
+            start = end = original_positions[0][0] if original_positions else 0
+        edits.append({
+            "start": base_offset + start,
+            "end": base_offset + end,
+            "original": original_text[start:end],
+            "suggestion": " ".join(corrected_words[j1:j2]),
+            "type": tag,
+            "word_index": base_word_index + i1,
+        })
+    return edits
+
+def split_document(document_text: str, tokenizer, max_tokens: int = 64) -> list:
     """
-    Xử lý một tài liệu:
-      - Tách tài liệu thành các đoạn dựa trên các ký tự xuống dòng liên tiếp,
-        bằng cách sử dụng biểu thức chính quy có nhóm bắt để giữ lại các ký tự xuống dòng gốc.
-      - Với mỗi đoạn (những đoạn không phải là chỉ chứa ký tự xuống dòng),
-        nếu số token vượt quá max_tokens thì tách thành các chunk nhỏ và xử lý từng phần,
-        còn lại thì xử lý trực tiếp.
-      - Ghép lại kết quả đã annotate mà vẫn giữ nguyên định dạng ban đầu của người dùng (bao gồm tab, khoảng trắng, newlines).
+    Split a document into paragraphs on runs of blank lines, keeping the separators.
+    Returns a list whose items are either a separator string (kept verbatim) or the
+    list of chunks of one paragraph, in document order. All paragraphs are tokenized
+    in a single batched tokenizer call.
     """
     # Dùng capturing group để tách các đoạn và giữ lại delimiter (các dòng xuống liên tiếp, có thể có khoảng trắng và tab)
     segments = re.split(r'(\n\s*\n)', document_text)
-    annotated_segments = []
-    
+    # Nếu segment chỉ chứa các ký tự xuống dòng (và khoảng trắng) thì giữ nguyên
+    paragraphs = [segment for segment in segments if not re.fullmatch(r'\n\s*\n', segment)]
+    encodings = tokenizer(paragraphs, add_special_tokens=False, return_offsets_mapping=True) if paragraphs else None
+
+    parts = []
+    paragraph_index = 0
     for segment in segments:
-        # Nếu segment chỉ chứa các ký tự xuống dòng (và khoảng trắng) thì giữ nguyên
         if re.fullmatch(r'\n\s*\n', segment):
-            annotated_segments.append(segment)
+            parts.append(segment)
         else:
             # Giữ nguyên cấu trúc ban đầu (không .strip() để bảo toàn tab, khoảng trắng ở đầu/đuôi)
-            text_segment = segment
-            tokens = tokenizer.tokenize(text_segment)
-            if len(tokens) > max_tokens:
-                chunks = split_text_into_chunks(text_segment, tokenizer, max_tokens)
-            else:
-                chunks = [text_segment]
-            
-            annotated_chunks = []
-            for chunk in chunks:
-                corrected_chunk = fix_grammar(chunk, tokenizer, model, device)
-                annotated_chunk = annotate_differences(chunk, corrected_chunk)
-                annotated_chunks.append(annotated_chunk)
-            # Ghép lại các chunk xử lý của đoạn đó (giữa các chunk mình nối bằng một khoảng trắng đơn)
-            annotated_text = "".join(annotated_chunks)
-            annotated_segments.append(annotated_text)
-    
-    # Ghép lại toàn bộ các segment theo đúng thứ tự ban đầu
-    return "".join(annotated_segments)
+            offsets = encodings["offset_mapping"][paragraph_index]
+            parts.append(pack_sentences(segment, offsets, max_tokens) or [segment])
+            paragraph_index += 1
+    return parts
+
+def document_chunks(parts: list) -> list:
+    """
+    All chunks of a split_document() result, in document order.
+    """
+    return [chunk for part in parts if isinstance(part, list) for chunk in part]
+
+def build_document_edits(parts: list, corrected_chunks: list) -> list:
+    """
+    Edits of a whole document, with offsets and word indices relative to the document.
+    corrected_chunks must be in the same order as document_chunks(parts); since the parts
+    tile the document, offsets are tracked with a running position.
+    """
+    corrected = iter(corrected_chunks)
+    edits = []
+    offset = 0
+    word_index = 0
+    for part in parts:
+        chunks = [part] if isinstance(part, str) else part
+        for chunk in chunks:
+            if not isinstance(part, str):
+                edits.extend(build_edits(chunk, next(corrected), base_offset=offset, base_word_index=word_index))
+            offset += len(chunk)
+            word_index += len(chunk.split())
+    return edits
+
+def process_document(document_text: str, tokenizer, model, device, max_tokens: int = 64) -> str:
+    """
+    Xử lý một tài liệu:
+      - Tách tài liệu thành các đoạn và chunk (split_document).
+      - Sửa ngữ pháp tất cả các chunk cùng lúc bằng các batch generate() (fix_grammar_batch).
+      - Tạo danh sách edit rồi render ra HTML, giữ nguyên định dạng ban đầu của người dùng.
+    """
+    parts = split_document(document_text, tokenizer, max_tokens)
+    corrected_chunks = fix_grammar_batch(document_chunks(parts), tokenizer, model, device, batch_size=COEDIT_MAX_BATCH_SIZE)
+    return render_edits_html(document_text, build_document_edits(parts, corrected_chunks))
 
 def wrap_words_with_click(text: str) -> str:
     words = text.split()
@@ -135,35 +273,126 @@ def wrap_words_with_click(text: str) -> str:
         for i, w in enumerate(words)
     )
 
-def annotated_html_with_ids(original_text: str, annotated_html: str) -> str:
-    original_words = original_text.split()
-    for i, word in enumerate(original_words):
-        annotated_html = re.sub(
-            rf"(<span class='(error|suggestion)'[^>]*?>){re.escape(word)}(</span>)",
-            rf"\1<span id='suggestion-word-{i}'>\2</span>\3",
-            annotated_html,
-            count=1
-        )
-    return annotated_html
-
-def postprocess_annotated_html(annotated_html: str) -> str:
-    # Normalize line endings
-    normalized = annotated_html.replace('\r\n', '\n')
-    # Replace single newlines inside paragraphs with space
-    normalized = re.sub(r'(?<!\n)\n(?!\n)', ' ', normalized)
-    # Split into paragraphs on double newlines
-    paragraphs = normalized.strip().split('\n\n')
-    # Wrap with <p> and add spacing
-    return ''.join(f"<p style='margin-bottom: 0.75em'>{p.strip()}</p>" for p in paragraphs if p.strip())
+def _html_text(text: str) -> str:
+    # Single newlines inside a paragraph are rendered as spaces
+    return html.escape(text.replace('\r\n', '\n').replace('\n', ' '), quote=False)
 
-async def get_annotated_fixed_essay(answer: str) -> str:
+def render_edits_html(text: str, edits: list) -> str:
+    """
+    Render the annotated essay HTML from an edit list in one linear pass over the text:
+    replaced/deleted spans become clickable error blocks (with the original word index
+    as id), inserts become suggestion spans, and paragraphs (split on blank lines) are
+    wrapped in <p>.
+    """
+    edits = sorted(edits, key=lambda edit: (edit["start"], edit["end"]))
+    paragraph_spans = []
+    start = 0
+    for match in re.finditer(r'\n\s*\n', text):
+        paragraph_spans.append((start, match.start()))
+        start = match.end()
+    paragraph_spans.append((start, len(text)))
+
+    paragraphs = []
+    edit_index = 0
+    for paragraph_start, paragraph_end in paragraph_spans:
+        pieces = []
+        cursor = paragraph_start
+        while edit_index < len(edits) and (
+            edits[edit_index]["start"] < paragraph_end
+            or (edits[edit_index]["start"] == paragraph_end and edits[edit_index]["type"] == "insert")
+        ):
+            edit = edits[edit_index]
+            pieces.append(_html_text(text[cursor:edit["start"]]))
+            suggestion = html.escape(edit["suggestion"], quote=True)
+            if edit["type"] == "insert":
+                pieces.append(f"<span class='suggestion'>{suggestion}</span>")
+            else:
+                pieces.append(
+                    f"<span class='error-block' id='suggestion-word-{edit['word_index']}' onclick='showSuggestion(this)' "
+                    f"data-suggestion='{suggestion}'>{_html_text(text[edit['start']:edit['end']])}</span>"
+                )
+            cursor = edit["end"]
+            edit_index += 1
+        pieces.append(_html_text(text[cursor:paragraph_end]))
+
+        paragraph_html = "".join(pieces).strip()
+        if paragraph_html:
+            paragraphs.append(f"<p style='margin-bottom: 0.75em'>{paragraph_html}</p>")
+    return "".join(paragraphs)
+
+def _merge_generated(chunks: list, corrected_chunks: list, missing: list, generated: list) -> list:
+    """
+    Splice freshly generated (correction, stats) pairs into the cached corrections, store
+    them in the correction cache and record the chunk metrics. Returns per-chunk stats.
+    """
+    chunk_stats = [{"cached": True} for _ in chunks]
+    for i, (corrected, stats) in zip(missing, generated):
+        corrected_chunks[i] = corrected
+        chunk_stats[i] = dict(stats, cached=False)
+        correction_cache.store(chunks[i], corrected)
+    observe_coedit_chunks(get_decoding_profile()["name"], chunk_stats)
+    return chunk_stats
+
+def _split_essay(original_text: str) -> list:
+    return split_document(original_text, coedit_tokenizer.get(), max_tokens=64)
+
+def _fix_chunk_batch(chunks: list) -> list:
+    # One (correction, stats) pair per chunk
+    loaded = get_coedit()
+    corrected, stats = fix_grammar_batch(chunks, loaded.tokenizer, loaded.model, loaded.device, batch_size=COEDIT_MAX_BATCH_SIZE, return_stats=True)
+    return list(zip(corrected, stats))
+
+# Chunks of concurrent documents share generate() batches when this is enabled
+coedit_batcher = MicroBatcher(
+    _fix_chunk_batch,
+    max_batch_size=COEDIT_MAX_BATCH_SIZE,
+    window_ms=COEDIT_BATCH_WINDOW_MS,
+    executor=get_inference_executor("coedit")
+)
+track_batcher("coedit", coedit_batcher)
+
+def warmup():
+    """
+    Load CoEdIT and correct one synthetic sentence. Returns the phase timings.
+    """
+    loaded = get_coedit()
+    phases = dict(coedit.phases)
+    with timed_phase(phases, "warmup"):
+        fix_grammar("This are a short sentence for warm up the model.", loaded.tokenizer, loaded.model, loaded.device)
+    return phases
+
+async def get_essay_edits(answer: str) -> dict:
+    """
+    Grammar-check an essay and return {"text": stripped essay, "edits": edit list,
+    "chunks": per-chunk decoding stats} (see build_edits for the edit format).
+    """
     original_text = answer.strip()
-    annotated_html = process_document(original_text, tokenizer, model, device, max_tokens=64)
-    annotated_html = annotated_html_with_ids(original_text, annotated_html)
-    # 👉 Final post-processing before returning
-    annotated_html = postprocess_annotated_html(annotated_html)
+    with stage_timer("coedit_chunking"):
+        parts = await asyncio.to_thread(_split_essay, original_text)
+    chunks = document_chunks(parts)
+
+    # Only chunks whose text is not in the correction cache (e.g. the edited part of a revision) are generated
+    corrected_chunks, missing = correction_cache.split_hits(chunks)
+    to_generate = [chunks[i] for i in missing]
+    if not to_generate:
+        generated = []
+    else:
+        # Includes the wait for the batch window and for the executor
+        with stage_timer("coedit_generate"):
+            if COEDIT_CROSS_DOCUMENT_BATCHING:
+                generated = await asyncio.gather(*(coedit_batcher.submit(chunk) for chunk in to_generate))
+            else:
+                generated = await get_inference_executor("coedit").run(_fix_chunk_batch, to_generate)
 
-    return annotated_html
+    chunk_stats = _merge_generated(chunks, corrected_chunks, missing, list(generated))
+
+    with stage_timer("coedit_annotate"):
+        edits = build_document_edits(parts, corrected_chunks)
+    return {"text": original_text, "edits": edits, "chunks": chunk_stats}
+
+async def get_annotated_fixed_essay(answer: str) -> str:
+    result = await get_essay_edits(answer)
+    return render_edits_html(result["text"], result["edits"])
 
 # TESTING WITH HTML (EDITABLE + CLICKABLE + TOTAL WORD COUNT (REAL TIME) + TOP 5 FREQUENT WORDS)
 # async def main():
@@ -0,0 +1,66 @@
+import os
+import torch
+import torch.nn as nn
+from transformers import T5ForConditionalGeneration
+
+from model_registry import COEDIT_REPO_ID, pretrained_kwargs, resolve_repo
+
+
+def load_fp32_coedit(device) -> nn.Module:
+    model = T5ForConditionalGeneration.from_pretrained(resolve_repo(COEDIT_REPO_ID), **pretrained_kwargs(COEDIT_REPO_ID)).to(device)
+    return model.eval()
+
+
+def load_int8_coedit() -> nn.Module:
+    """
+    PyTorch dynamic INT8 quantization of every nn.Linear (attention, feed-forward and
+    lm_head). Weights are stored as int8, which cuts the model's memory to roughly a
+    quarter; activations are quantized on the fly, so no calibration data is needed.
+    CPU only.
+    """
+    model = load_fp32_coedit(torch.device("cpu"))
+    return torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def load_onnx_coedit(onnx_dir: str, intra_op_threads: int = 0):
+    """
+    CoEdIT as ONNX encoder, decoder and decoder-with-past graphs run by ONNX Runtime through
+    optimum's ORTModelForSeq2SeqLM. Past key values are reused between decoding steps, and the
+    model keeps the transformers generate() API, so decoding profiles and stopping criteria
+    apply unchanged. The graphs are exported to `onnx_dir` on first use and reused afterwards.
+    """
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads > 0:
+        options.intra_op_num_threads = intra_op_threads
+
+    if not os.path.exists(os.path.join(onnx_dir, "config.json")):
+        model = ORTModelForSeq2SeqLM.from_pretrained(
+            resolve_repo(COEDIT_REPO_ID), export=True, use_cache=True, **pretrained_kwargs(COEDIT_REPO_ID)
+        )
+        model.save_pretrained(onnx_dir)
+        print(f"Exported CoEdIT to {onnx_dir}")
+
+    return ORTModelForSeq2SeqLM.from_pretrained(
+        onnx_dir, use_cache=True, provider="CPUExecutionProvider", session_options=options
+    )
+
+
+GRAMMAR_BACKENDS = ("eager", "int8", "onnx")
+
+
+def load_grammar_backend(name: str, device, onnx_dir: str = "artifacts/coedit_onnx", intra_op_threads: int = 0):
+    """
+    Load CoEdIT for the backend called `name`. Returns (model, device); every backend
+    exposes generate(), and int8/onnx always run on the CPU.
+    """
+    if name == "eager":
+        return load_fp32_coedit(device), device
+    if name == "int8":
+        return load_int8_coedit(), torch.device("cpu")
+    if name == "onnx":
+        return load_onnx_coedit(onnx_dir, intra_op_threads=intra_op_threads), torch.device("cpu")
+    raise ValueError(f"Unknown grammar backend {name!r}, expected one of {GRAMMAR_BACKENDS}")
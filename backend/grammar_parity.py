@@ -0,0 +1,109 @@
+"""
+Compare the grammar edits of the alternative CoEdIT backends against the eager fp32 model.
+
+Usage:
+    python grammar_parity.py --essays reference_essays.csv [--backends int8 onnx] [--min-f1 0.9]
+
+The reference set is a CSV or JSONL file with an "answer" field. Every essay is chunked
+and corrected by each backend, and its edit list (see grammar.build_edits) is compared
+with the eager model's. An edit matches when its span and suggestion are identical.
+A backend passes when the F1 of its edits against the eager edits reaches --min-f1.
+The report also lists seconds per essay and the process RSS growth while the
+backend was loaded, so the cheapest passing backend can be chosen with COEDIT_BACKEND.
+"""
+import argparse
+import csv
+import gc
+import json
+import os
+import sys
+import time
+import torch
+
+import grammar
+from grammar_backends import load_grammar_backend
+
+
+def load_reference_essays(path: str):
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path, encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+    return [str(row["answer"]).strip() for row in rows]
+
+
+def rss_mb() -> float:
+    # Resident set size of this process, Linux only
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        return float("nan")
+
+
+def edits_with_backend(model, device, essays, tokenizer, batch_size: int):
+    edit_sets = []
+    start_time = time.perf_counter()
+    for essay in essays:
+        parts = grammar.split_document(essay, tokenizer, max_tokens=64)
+        corrected = grammar.fix_grammar_batch(grammar.document_chunks(parts), tokenizer, model, device, batch_size=batch_size)
+        edits = grammar.build_document_edits(parts, corrected)
+        edit_sets.append({(edit["start"], edit["end"], edit["suggestion"]) for edit in edits})
+    return edit_sets, time.perf_counter() - start_time
+
+
+def compare(edit_sets, reference_sets):
+    matched = sum(len(edits & reference) for edits, reference in zip(edit_sets, reference_sets))
+    predicted = sum(len(edits) for edits in edit_sets)
+    expected = sum(len(reference) for reference in reference_sets)
+    precision = matched / predicted if predicted else 1.0
+    recall = matched / expected if expected else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    identical = sum(edits == reference for edits, reference in zip(edit_sets, reference_sets)) / len(reference_sets)
+    return precision, recall, f1, identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays", required=True, help="CSV or JSONL file with an answer field")
+    parser.add_argument("--backends", nargs="+", default=["int8", "onnx"])
+    parser.add_argument("--min-f1", type=float, default=float(os.getenv("GRAMMAR_PARITY_MIN_F1", "0.9")),
+                        help="Minimum F1 of a backend's edits against the eager edits")
+    parser.add_argument("--batch-size", type=int, default=grammar.COEDIT_MAX_BATCH_SIZE)
+    args = parser.parse_args()
+
+    essays = [essay for essay in load_reference_essays(args.essays) if essay]
+    if not essays:
+        sys.exit(f"No essays found in {args.essays}")
+
+    tokenizer = grammar.coedit_tokenizer.get()
+    device = torch.device("cpu")
+
+    def run(name):
+        before = rss_mb()
+        model, backend_device = load_grammar_backend(name, device, onnx_dir=grammar.COEDIT_ONNX_DIR)
+        memory = rss_mb() - before
+        edit_sets, elapsed = edits_with_backend(model, backend_device, essays, tokenizer, args.batch_size)
+        del model
+        gc.collect()
+        return edit_sets, elapsed, memory
+
+    reference_sets, reference_time, reference_memory = run("eager")
+    print(f"{'backend':<8} {'precision':>10} {'recall':>8} {'f1':>7} {'identical':>10} {'s/essay':>9} {'rss MB':>8}  result")
+    print(f"{'eager':<8} {1.0:>10.2%} {1.0:>8.2%} {1.0:>7.3f} {1.0:>10.2%} {reference_time / len(essays):>9.3f} {reference_memory:>8.0f}  reference")
+
+    all_passed = True
+    for name in args.backends:
+        edit_sets, elapsed, memory = run(name)
+        precision, recall, f1, identical = compare(edit_sets, reference_sets)
+        passed = f1 >= args.min_f1
+        all_passed = all_passed and passed
+        print(f"{name:<8} {precision:>10.2%} {recall:>8.2%} {f1:>7.3f} {identical:>10.2%} {elapsed / len(essays):>9.3f} {memory:>8.0f}  {'PASS' if passed else 'FAIL'}")
+
+    sys.exit(0 if all_passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 import json
 
+from metrics import JSON_PARSES
+
 # Hàm thay ngoặc cong thành ngoặc thẳng
 def normalize_quotes(text):
     replacements = {
@@ -16,27 +18,155 @@ def strip_json_fence(text):
     lines = [line for line in lines if not line.strip().startswith("```")]
     return "\n".join(lines)
 
-def read_json_from_string(text: str) -> dict:
+SMART_OPEN_QUOTES = "“"
+SMART_CLOSE_QUOTES = "”"
+# After a real closing quote the next character is structural (or the text ends), or the
+# opening quote of the next string when the LLM forgot the comma between them
+STRING_END_FOLLOWERS = ',:}]"'
+
+def _next_significant(text, i):
+    while i < len(text) and text[i].isspace():
+        i += 1
+    return text[i] if i < len(text) else ""
+
+def _last_significant(out):
+    for piece in reversed(out):
+        stripped = piece.rstrip()
+        if stripped:
+            return stripped[-1]
+    return ""
+
+def _needs_comma(out):
+    # A value or key starts right after another value: the LLM forgot the comma
+    last = _last_significant(out)
+    return last != "" and (last in '"}]' or last.isalnum())
+
+def _drop_trailing_comma(out):
+    for i in range(len(out) - 1, -1, -1):
+        if out[i].strip():
+            if out[i].rstrip().endswith(","):
+                out[i] = out[i].rstrip()[:-1]
+            return
+
+def repair_json(text: str) -> str:
+    """
+    Repair the JSON mistakes LLM output commonly has locally, without another LLM call:
+    fence ```, prose before/after the object, smart quotes used as delimiters, trailing
+    commas, missing commas between values, missing values ("key": }), raw newlines/tabs and unescaped quotes inside
+    strings, and brackets left open by a truncated reply. Returns the repaired text,
+    which may still be invalid JSON.
+    """
+    text = strip_json_fence(text)
+    start = next((i for i, char in enumerate(text) if char in "{["), None)
+    if start is None:
+        return text
+
+    out = []
+    stack = []
+    in_string = False
+    smart_string = False
+    i = start
+    while i < len(text):
+        char = text[i]
+        if in_string:
+            if char == "\\" and i + 1 < len(text):
+                out.append(text[i:i + 2])
+                i += 2
+                continue
+            closes = char == '"' or (smart_string and char in SMART_CLOSE_QUOTES)
+            if closes:
+                if _next_significant(text, i + 1) in STRING_END_FOLLOWERS:
+                    out.append('"')
+                    in_string = False
+                else:
+                    # A quote inside the text, e.g. He said "hello"
+                    out.append('\\"' if char == '"' else char)
+            elif char == "\n":
+                out.append("\\n")
+            elif char == "\r":
+                pass
+            elif char == "\t":
+                out.append("\\t")
+            else:
+                out.append(char)
+        else:
+            if char == '"' or char in SMART_OPEN_QUOTES or char in SMART_CLOSE_QUOTES:
+                if _needs_comma(out):
+                    out.append(",")
+                out.append('"')
+                in_string = True
+                smart_string = char != '"'
+            elif char in "{[":
+                if _needs_comma(out):
+                    out.append(",")
+                stack.append("}" if char == "{" else "]")
+                out.append(char)
+            elif char in "}]":
+                if stack:
+                    if _last_significant(out) == ":":
+                        # "key": } -- the value is missing
+                        out.append("null")
+                    _drop_trailing_comma(out)
+                    out.append(stack.pop())
+                    if not stack:
+                        # Anything after the top-level value is stray prose
+                        break
+            elif char == "," and _last_significant(out) == ":":
+                out.append("null,")
+            else:
+                out.append(char)
+        i += 1
+
+    # Truncated reply: close the open string and brackets
+    if in_string:
+        out.append('"')
+    if stack:
+        if _last_significant(out) == ":":
+            out.append("null")
+        _drop_trailing_comma(out)
+        out.extend(reversed(stack))
+    return "".join(out)
+
+def read_json_from_string(text: str, source: str = None) -> dict:
     """
     Nhận vào một chuỗi có chứa JSON (có thể có fence ```json``` hoặc ngoặc cong),
-    rồi làm sạch và parse thành dict.
+    rồi làm sạch và parse thành dict. Nếu vẫn lỗi, thử sửa cục bộ bằng repair_json.
     Trả về:
       - valid_json: True/False
       - top_keys: danh sách key ở cấp cao nhất (nếu valid_json)
       - parsed: object đã parse (nếu valid_json)
+      - repaired: True nếu phải dùng repair_json (nếu valid_json)
       - error: lỗi decode (nếu invalid)
+    Nếu có `source`, kết quả (clean, local_fixed, failed) được đếm dưới label đó.
     """
     # Làm sạch dấu ngoặc “ ” trở thành " và loại bỏ fence ``` 
     cleaned = normalize_quotes(strip_json_fence(text))
     try:
         parsed = json.loads(cleaned)
-        return {
-            "valid_json": True,
-            "top_keys": list(parsed.keys()),
-            "parsed": parsed
-        }
+        repaired = False
     except json.JSONDecodeError as e:
+        try:
+            parsed = json.loads(repair_json(text))
+            repaired = True
+        except json.JSONDecodeError:
+            if source:
+                JSON_PARSES.labels(source, "failed").inc()
+            return {
+                "valid_json": False,
+                "error": str(e)
+            }
+    if not isinstance(parsed, dict):
+        if source:
+            JSON_PARSES.labels(source, "failed").inc()
         return {
             "valid_json": False,
-            "error": str(e)
-        }
\ No newline at end of file
+            "error": f"Expected a JSON object, got {type(parsed).__name__}"
+        }
+    if source:
+        JSON_PARSES.labels(source, "local_fixed" if repaired else "clean").inc()
+    return {
+        "valid_json": True,
+        "top_keys": list(parsed.keys()),
+        "parsed": parsed,
+        "repaired": repaired
+    }
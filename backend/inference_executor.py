@@ -0,0 +1,98 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from metrics import track_executor
+
+load_dotenv()
+
+# Per-model defaults; each can be overridden with <NAME>_EXECUTOR, <NAME>_EXECUTOR_WORKERS
+# and <NAME>_TORCH_THREADS, e.g. BERT_EXECUTOR_WORKERS=2 or COEDIT_EXECUTOR=process.
+EXECUTOR_DEFAULTS = {
+    "bert":   {"kind": "thread", "workers": 1, "torch_threads": 0},
+    "coedit": {"kind": "thread", "workers": 1, "torch_threads": 0},
+}
+
+
+def _init_worker(torch_threads: int):
+    # Runs once in every worker thread/process before it picks up any job
+    if torch_threads > 0:
+        import torch
+        torch.set_num_threads(torch_threads)
+
+
+class InferenceExecutor:
+    """
+    A dedicated pool for one model. Blocking inference calls are submitted here so
+    the event loop only awaits their futures, and `workers` caps how many calls of
+    this model run at the same time.
+
+    kind="thread" shares the already-loaded model with the API process.
+    kind="process" runs jobs in spawned worker processes; submitted functions must be
+    module-level (picklable) and each worker loads its own copy of the model.
+    """
+
+    def __init__(self, name: str, kind: str = "thread", workers: int = 1, torch_threads: int = 0):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Executor kind must be 'thread' or 'process', got {kind!r}")
+        self.name = name
+        self.kind = kind
+        self.workers = max(workers, 1)
+        self.torch_threads = torch_threads
+        self.pending = 0  # jobs submitted and not finished yet (queued + running)
+
+        if kind == "thread":
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix=f"{name}-inference",
+                initializer=_init_worker,
+                initargs=(torch_threads,),
+            )
+        else:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(torch_threads,),
+            )
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        try:
+            return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self.pending -= 1
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_executors = {}
+
+
+def get_inference_executor(name: str) -> InferenceExecutor:
+    """
+    Return the process-wide executor for `name`, creating it from the environment
+    on first use.
+    """
+    if name not in _executors:
+        defaults = EXECUTOR_DEFAULTS.get(name, {"kind": "thread", "workers": 1, "torch_threads": 0})
+        prefix = name.upper()
+        _executors[name] = InferenceExecutor(
+            name,
+            kind=os.getenv(f"{prefix}_EXECUTOR", defaults["kind"]),
+            workers=int(os.getenv(f"{prefix}_EXECUTOR_WORKERS", str(defaults["workers"]))),
+            torch_threads=int(os.getenv(f"{prefix}_TORCH_THREADS", str(defaults["torch_threads"]))),
+        )
+        track_executor(_executors[name])
+    return _executors[name]
+
+
+def shutdown_inference_executors(wait: bool = True):
+    for executor in _executors.values():
+        executor.shutdown(wait=wait)
+    _executors.clear()
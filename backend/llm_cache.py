@@ -0,0 +1,137 @@
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from lru_cache import LRUCache
+from metrics import CACHE_HITS, CACHE_MISSES, SINGLE_FLIGHT_COALESCED, track_lru_cache
+
+load_dotenv()
+
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Also keep responses in the "llm_cache" MongoDB collection; documents expire after LLM_CACHE_TTL_SECONDS
+LLM_CACHE_PERSIST = os.getenv("LLM_CACHE_PERSIST", "false").lower() == "true"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def llm_cache_key(operation: str, template_version: str, models, *inputs: str) -> str:
+    """
+    Key of an LLM pipeline result: the operation, the version of its prompt templates,
+    the models involved and the inputs. Inputs are NFKC-normalized with whitespace
+    collapsed; case is kept, since the feedback quotes the essay.
+    """
+    normalized = [re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip() for text in inputs]
+    payload = json.dumps([operation, template_version, list(models), normalized], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one computation; every caller
+    gets its result (or exception). The shared task is shielded, so a caller that
+    disconnects does not cancel it for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks = {}
+
+    async def do(self, key: str, compute):
+        task = self._tasks.get(key)
+        if task is not None:
+            SINGLE_FLIGHT_COALESCED.labels(self.name).inc()
+        else:
+            task = asyncio.ensure_future(compute())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache of finished LLM pipeline results (JSON-serializable dicts) with
+    single-flight deduplication of misses.
+
+    The in-memory tier is an LRUCache. The optional persistent tier is an async (Motor)
+    MongoDB collection with a TTL index on created_at, attached at startup. It is
+    best effort: its errors are logged and count as misses, and writes to it run in
+    the background, so a MongoDB outage never fails or discards a computed result.
+    """
+
+    def __init__(self, name: str = "llm", max_entries: int = LLM_CACHE_MAX_ENTRIES, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.name = name
+        self.memory = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self.collection = None
+        self.in_flight = SingleFlight(name)
+        # References to the background writes, so they are not garbage collected mid-flight
+        self._writes = set()
+        track_lru_cache(name, self.memory)
+
+    async def attach_collection(self, collection, ttl_seconds: int = LLM_CACHE_TTL_SECONDS):
+        await collection.create_index("created_at", expireAfterSeconds=ttl_seconds)
+        self.collection = collection
+
+    async def get(self, key: str):
+        value = self.memory.get(key)
+        if value is not None:
+            CACHE_HITS.labels(self.name, "memory").inc()
+            return value
+
+        if self.collection is not None:
+            try:
+                doc = await self.collection.find_one({"_id": key})
+            except Exception as e:
+                print(f"{self.name} cache read failed, computing without it: {e!r}")
+                doc = None
+            if doc is not None:
+                self.memory.put(key, doc["value"])
+                CACHE_HITS.labels(self.name, "mongo").inc()
+                return doc["value"]
+
+        CACHE_MISSES.labels(self.name).inc()
+        return None
+
+    async def put(self, key: str, value: dict):
+        self.memory.put(key, value)
+        if self.collection is not None:
+            doc = {"value": value, "created_at": datetime.utcnow()}
+            task = asyncio.create_task(self._persist(key, doc))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    async def _persist(self, key: str, doc: dict):
+        try:
+            await self.collection.replace_one({"_id": key}, doc, upsert=True)
+        except Exception as e:
+            print(f"{self.name} cache write failed: {e!r}")
+
+    async def get_or_compute(self, key: str, compute):
+        """
+        Cached value for `key`, or the result of `compute()` (an async callable), which is
+        stored afterwards. Concurrent misses for the same key share one compute() call.
+        Exceptions are not cached. Every caller gets its own copy of the value.
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            CACHE_HITS.labels(self.name, "memory").inc()
+            return copy.deepcopy(value)
+
+        async def load():
+            cached = await self.get(key)
+            if cached is not None:
+                return cached
+            result = await compute()
+            await self.put(key, result)
+            return result
+
+        return copy.deepcopy(await self.in_flight.do(key, load))
+
+
+llm_cache = LLMResponseCache()
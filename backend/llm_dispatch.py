@@ -0,0 +1,313 @@
+import asyncio
+import os
+import random
+import re
+import time
+from collections import defaultdict, deque
+
+import httpx
+from dotenv import load_dotenv
+from google.genai import errors as genai_errors
+
+from metrics import LLM_CALLS, LLM_CIRCUIT_STATE, LLM_HEDGES, LLM_IN_FLIGHT
+
+load_dotenv()
+
+# Retries of a failed or throttled LLM call: the n-th retry waits about RETRY_DELAY * 2**n seconds (jittered)
+RETRY_DELAY = float(os.getenv("RETRY_DELAY", "1"))
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
+# How long a key is skipped after a 429 that does not say when to retry
+LLM_RATE_LIMIT_COOLDOWN_SECONDS = float(os.getenv("LLM_RATE_LIMIT_COOLDOWN_SECONDS", "20"))
+# Send a duplicate request on another key when a call is slower than this; 0 uses the observed p95
+LLM_HEDGING = os.getenv("LLM_HEDGING", "true").lower() == "true"
+LLM_HEDGE_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DELAY_SECONDS", "0"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Consecutive failures that open a backend's circuit, and how long it stays open
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a backend whose circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures, rejects calls for
+    `reset_seconds`, then lets a single trial call through (half open). A success
+    closes it again; a failed trial re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = LLM_BREAKER_FAILURES, reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        LLM_CIRCUIT_STATE.labels(name).set_function(lambda: CIRCUIT_STATES[self.state])
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_running:
+            self.trial_running = True
+            return True
+        return False
+
+    def available(self) -> bool:
+        # Like allow(), without claiming the half-open trial
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.trial_running)
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_running or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.trial_running = False
+
+    def release(self):
+        # The call ended without telling anything about the backend (e.g. it was cancelled)
+        self.trial_running = False
+
+
+def backoff_seconds(attempt: int, base: float = RETRY_DELAY) -> float:
+    # Full jitter around the exponential delay, so retries of concurrent calls spread out
+    return base * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+def retry_after_seconds(error) -> float:
+    """
+    The retry delay the API suggested in a 429 (RetryInfo "retryDelay": "12s"), if any.
+    """
+    match = re.search(r"retryDelay['\"]?\s*:\s*['\"]?(\d+(?:\.\d+)?)s", str(getattr(error, "details", "") or error))
+    return float(match.group(1)) if match else None
+
+
+def is_rate_limit(error) -> bool:
+    return isinstance(error, genai_errors.ClientError) and error.code == 429
+
+
+def is_rejected(error) -> bool:
+    # A 4xx other than 429: the request's fault, says nothing about the key's health
+    return isinstance(error, genai_errors.ClientError) and error.code != 429
+
+
+def is_retryable(error) -> bool:
+    # Throttling, server errors and transport failures (refused, reset, protocol errors, timeouts)
+    if isinstance(error, genai_errors.ClientError):
+        return error.code == 429
+    return (isinstance(error, (genai_errors.ServerError, httpx.TransportError, OSError, TimeoutError))
+            or "timeout" in type(error).__name__.lower())
+
+
+class KeySlot:
+    """
+    One Gemini API key: its client, in-flight call count, rate-limit cooldown and breaker.
+    """
+
+    def __init__(self, name: str, client):
+        self.name = name
+        self.client = client
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.breaker = CircuitBreaker(name)
+        LLM_IN_FLIGHT.labels(name).set_function(lambda: self.in_flight)
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until and self.breaker.available()
+
+
+class GeminiKeyPool:
+    """
+    Dispatches Gemini calls across a pool of API keys.
+
+    Each call goes to the least-loaded key that is neither cooling down after a 429
+    nor behind an open circuit. Throttled or failed calls are retried on the next
+    best key with jittered exponential backoff (RETRY_DELAY, MAX_RETRIES). If a call
+    is still running after the hedge delay (LLM_HEDGE_DELAY_SECONDS, or the p95 of
+    recent latencies of the same operation), a duplicate is sent on another key and
+    the first result wins.
+
+    `request(client, key_name)` is a blocking function performing one call with the
+    given key's client; it runs in a worker thread. The key name lets a call use
+    per-key state, such as the band descriptor file uploaded with that key.
+    """
+
+    def __init__(self, clients: dict, max_retries: int = MAX_RETRIES, hedging: bool = LLM_HEDGING,
+                 hedge_delay_seconds: float = LLM_HEDGE_DELAY_SECONDS):
+        if not clients:
+            raise ValueError("GeminiKeyPool needs at least one API key")
+        self.slots = [KeySlot(name, client) for name, client in clients.items()]
+        self.max_retries = max_retries
+        self.hedging = hedging
+        self.hedge_delay_seconds = hedge_delay_seconds
+        # Latency windows per operation: a slow operation must not be hedged against a fast one's p95
+        self.latencies = defaultdict(lambda: deque(maxlen=500))
+
+    def pick(self, exclude=()):
+        candidates = [slot for slot in self.slots if slot.available() and slot not in exclude]
+        if not candidates:
+            return None
+        least = min(slot.in_flight for slot in candidates)
+        return random.choice([slot for slot in candidates if slot.in_flight == least])
+
+    def hedge_delay(self, operation: str):
+        if not self.hedging or len(self.slots) < 2:
+            return None
+        if self.hedge_delay_seconds > 0:
+            return self.hedge_delay_seconds
+        latencies = self.latencies[operation]
+        if len(latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    async def _call(self, slot: KeySlot, request, operation: str):
+        if not slot.breaker.allow():
+            raise CircuitOpenError(f"Gemini key {slot.name} circuit is open")
+        slot.in_flight += 1
+        start_time = time.perf_counter()
+        try:
+            result = await asyncio.to_thread(request, slot.client, slot.name)
+        except Exception as e:
+            if is_rate_limit(e):
+                slot.cooldown_until = time.monotonic() + (retry_after_seconds(e) or LLM_RATE_LIMIT_COOLDOWN_SECONDS)
+                # Throttling says nothing about the key's health
+                slot.breaker.record_success()
+                LLM_CALLS.labels("gemini", slot.name, operation, "rate_limited").inc()
+            elif is_rejected(e):
+                slot.breaker.record_success()
+                LLM_CALLS.labels("gemini", slot.name, operation, "rejected").inc()
+            else:
+                slot.breaker.record_failure()
+                LLM_CALLS.labels("gemini", slot.name, operation, "error").inc()
+            raise
+        except BaseException:
+            slot.breaker.release()
+            raise
+        finally:
+            slot.in_flight -= 1
+        slot.breaker.record_success()
+        self.latencies[operation].append(time.perf_counter() - start_time)
+        LLM_CALLS.labels("gemini", slot.name, operation, "success").inc()
+        return result
+
+    async def _hedged_call(self, slot: KeySlot, request, operation: str):
+        primary = asyncio.ensure_future(self._call(slot, request, operation))
+        delay = self.hedge_delay(operation)
+        if delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        hedge_slot = None if done else self.pick(exclude=(slot,))
+        if hedge_slot is None:
+            return await primary
+
+        LLM_HEDGES.labels(operation, "sent").inc()
+        hedge = asyncio.ensure_future(self._call(hedge_slot, request, operation))
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        # The losing thread finishes in the background; its result is dropped
+                        other.add_done_callback(lambda t: t.exception())
+                    if task is hedge:
+                        LLM_HEDGES.labels(operation, "won").inc()
+                    return task.result()
+                error = task.exception()
+        raise error
+
+    async def generate(self, request, operation: str = "generate"):
+        """
+        Run `request` on the pool with key selection, retries and hedging; returns its result.
+        """
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            slot = self.pick()
+            if slot is None:
+                # Every key is throttled or broken: wait for the earliest cooldown
+                wait = min(max(s.cooldown_until - time.monotonic(), 0.0) for s in self.slots)
+                await asyncio.sleep(max(wait, backoff_seconds(attempt)))
+                slot = self.pick()
+                if slot is None:
+                    last_error = last_error or CircuitOpenError("No Gemini key is available")
+                    continue
+            try:
+                return await self._hedged_call(slot, request, operation)
+            except CircuitOpenError as e:
+                last_error = e
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                last_error = e
+                if attempt < self.max_retries and not is_rate_limit(e):
+                    await asyncio.sleep(backoff_seconds(attempt))
+        raise last_error
+
+
+class OllamaDispatcher:
+    """
+    Circuit breaker and retries around calls to the Ollama server. While the circuit is
+    open, calls fail immediately with CircuitOpenError instead of waiting for timeouts.
+    """
+
+    def __init__(self, max_retries: int = MAX_RETRIES):
+        self.breaker = CircuitBreaker("ollama")
+        self.max_retries = max_retries
+
+    async def call(self, make_call, operation: str = "chat"):
+        """
+        Await `make_call()` (a coroutine function), retrying transport and 5xx errors.
+        """
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                LLM_CALLS.labels("ollama", "ollama", operation, "circuit_open").inc()
+                raise CircuitOpenError("Ollama circuit is open")
+            try:
+                result = await make_call()
+            except httpx.HTTPError as e:
+                # Transport errors, 5xx and errors Ollama reports inside the stream are server side
+                server_side = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code >= 500
+                if not server_side:
+                    self.breaker.record_success()
+                    LLM_CALLS.labels("ollama", "ollama", operation, "rejected").inc()
+                    raise
+                self.breaker.record_failure()
+                LLM_CALLS.labels("ollama", "ollama", operation, "error").inc()
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(backoff_seconds(attempt))
+                continue
+            except Exception:
+                self.breaker.record_failure()
+                LLM_CALLS.labels("ollama", "ollama", operation, "error").inc()
+                raise
+            except BaseException:
+                # Cancelled: free a half-open trial so the next call can probe again
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            LLM_CALLS.labels("ollama", "ollama", operation, "success").inc()
+            return result
@@ -0,0 +1,72 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+def approximate_size(value) -> int:
+    """
+    Rough in-memory size of a cached value in bytes (containers are measured one level deep).
+    """
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(k) + approximate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(approximate_size(v) for v in value)
+    nbytes = getattr(value, "nbytes", None)  # NumPy arrays
+    if nbytes is not None:
+        return int(nbytes) + 112
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by entry count and by total size in bytes.
+    The least recently used entries are evicted until both limits hold again.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, sizeof=approximate_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self.current_bytes -= self._data.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._data[key] = (value, size)
+            self.current_bytes += size
+            while len(self._data) > self.max_entries or self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
@@ -6,18 +6,30 @@ from datetime import datetime
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi import HTTPException
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
 from pydantic import BaseModel
+from typing import List, Optional
 
 import uvicorn
 from gemma import get_feedback
+from clients import create_clients
+from database import DB_NAME, SESSIONS_MAX_PAGE_SIZE, SESSIONS_PAGE_SIZE, SESSIONS_COLLECTION, SessionWriter, create_mongo_client, ensure_indexes, find_session, list_sessions_page, session_document
+from contextlib import asynccontextmanager
 from get_essay_statistics import get_essay_statistics
-from grammar import get_annotated_fixed_essay
+from grammar import get_annotated_fixed_essay, get_essay_edits, render_edits_html
+from inference_executor import shutdown_inference_executors
+from score_cache import score_cache, SCORE_CACHE_PERSIST
+from llm_cache import llm_cache, LLM_CACHE_PERSIST
 from fastapi.middleware.cors import CORSMiddleware
 from prometheus_client import generate_latest, REGISTRY, CONTENT_TYPE_LATEST, Counter, Histogram
-from fastapi.responses import Response
+from starlette.routing import Match
+from metrics import HTTP_IN_FLIGHT, stage_timer
+from fastapi.responses import JSONResponse, Response
 import time
+import bert_setup
+from bert_setup import score_essays
+import grammar
+from inference_executor import get_inference_executor
+from model_registry import MODEL_LOADING, StartupStatus
 
 load_dotenv()
 # Prometheus metrics
@@ -39,29 +51,78 @@ except ValueError:
     REQUEST_LATENCY = REGISTRY._names_to_collectors.get("http_request_duration_seconds")
 
 
-# MongoDB configuration
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
-MONGO_URI = os.getenv("MONGODB_URI")
-DB_NAME   = os.getenv("MONGODB_DB_NAME", "essay")
 
-# Initialize Mongo client and database
-client = MongoClient(MONGO_URI, server_api=ServerApi('1'))
-db = client[DB_NAME]
+startup_status = StartupStatus()
 
-# Define collections
-feedback_col   = db["feedback"]
-stats_col      = db["statistics"]
-annotation_col = db["annotations"]
+async def _warm_up_model(name, warmup):
+    try:
+        # Runs on the model's own executor, so the models load in parallel
+        startup_status.models[name] = await get_inference_executor(name).run(warmup)
+    except Exception as e:
+        startup_status.errors[name] = repr(e)
+
+async def warm_up_models():
+    await asyncio.gather(
+        _warm_up_model("bert", bert_setup.warmup),
+        _warm_up_model("coedit", grammar.warmup),
+    )
+    startup_status.finished_at = time.perf_counter()
+    print(f"Model warmup finished: {startup_status.report()}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Async MongoDB client (pooled) shared by every request
+    app.state.mongo = create_mongo_client()
+    app.state.db = app.state.mongo[DB_NAME]
+    await ensure_indexes(app.state.db)
+    if SCORE_CACHE_PERSIST:
+        await score_cache.attach_collection(app.state.db["score_cache"])
+    if LLM_CACHE_PERSIST:
+        await llm_cache.attach_collection(app.state.db["llm_cache"])
+    # Session documents are written directly or through the write-behind queue (MONGO_WRITE_MODE)
+    app.state.session_writer = SessionWriter(app.state.db)
+    app.state.session_writer.start()
+    # Pooled Ollama/Gemini clients shared by every request
+    app.state.clients = create_clients()
+
+    if MODEL_LOADING == "lazy":
+        # Models load on their first request
+        startup_status.finished_at = time.perf_counter()
+    else:
+        app.state.warmup_task = asyncio.create_task(warm_up_models())
+
+    yield
+
+    # Flush queued session documents before the client is closed
+    await app.state.session_writer.close()
+    app.state.mongo.close()
+    shutdown_inference_executors(wait=False)
+    await app.state.clients.aclose()
+
+app = FastAPI(title="IELTS Essay Scoring API", lifespan=lifespan)
+def route_template(request) -> str:
+    # Label by route template ("/session/{session_id}"), not the raw path, so ids do not create new series
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path)
+    return "unmatched"
 
-app = FastAPI(title="IELTS Essay Scoring API")
 @app.middleware("http")
 async def prometheus_middleware(request, call_next):
+    endpoint = route_template(request)
+    HTTP_IN_FLIGHT.labels(request.method, endpoint).inc()
     start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-
-    REQUEST_LATENCY.labels(request.method, request.url.path).observe(process_time)
-    REQUEST_COUNT.labels(request.method, request.url.path, response.status_code).inc()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        process_time = time.time() - start_time
+        HTTP_IN_FLIGHT.labels(request.method, endpoint).dec()
+        REQUEST_LATENCY.labels(request.method, endpoint).observe(process_time)
+        REQUEST_COUNT.labels(request.method, endpoint, status_code).inc()
 
     return response
 
@@ -73,30 +134,64 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-@app.on_event("startup")
-async def startup_db():
-    # Ensure MongoDB connection is established
-    _ = client
 class Feedback(BaseModel):
     question: str
     answer: str
 
+class ScoreRequest(BaseModel):
+    # Either a single essay (question + answer) or a list of essays
+    question: Optional[str] = None
+    answer: Optional[str] = None
+    essays: Optional[List[Feedback]] = None
+
+# Upper bound on essays per /score request
+SCORE_MAX_ESSAYS = int(os.getenv("SCORE_MAX_ESSAYS", "100"))
+
 # get root
 @app.get("/")
 async def root():
     return {"message": "Welcome to the IELTS Essay Scoring API"}
 @app.post("/get_feedback")
 async def get_feedback_endpoint(question: str, answer: str):
-    response = await get_feedback(question, answer)
+    response = await get_feedback(question, answer, app.state.clients)
     return response
 
+@app.post("/score")
+async def score_endpoint(request: ScoreRequest):
+    """
+    Band score only: no LLM feedback, statistics or grammar annotation.
+    Scores are returned in the same order as the input essays.
+    """
+    if request.essays is not None:
+        pairs = [(essay.question, essay.answer) for essay in request.essays]
+    elif request.question is not None and request.answer is not None:
+        pairs = [(request.question, request.answer)]
+    else:
+        raise HTTPException(status_code=422, detail="Provide either question and answer, or essays")
+
+    if not pairs:
+        return {"scores": []}
+    if len(pairs) > SCORE_MAX_ESSAYS:
+        raise HTTPException(status_code=413, detail=f"At most {SCORE_MAX_ESSAYS} essays per request")
+
+    scores = await score_essays(pairs)
+    return {"scores": scores}
+
 @app.post("/get_essay_statistics")
 async def get_essay_statistics_endpoint(answer: str):
-    stats = await get_essay_statistics(answer)
+    stats = await get_essay_statistics(answer, app.state.clients.gemini_pool)
     return stats
 
 @app.post("/get_annotated_fixed_essay")
-async def get_annotated_fixed_essay_endpoint(answer: str):
+async def get_annotated_fixed_essay_endpoint(answer: str, format: str = "html"):
+    """
+    format=html (default) returns the annotated essay HTML; format=edits returns the
+    compact {"text", "edits"} edit list it is rendered from.
+    """
+    if format == "edits":
+        return await get_essay_edits(answer)
+    if format != "html":
+        raise HTTPException(status_code=422, detail="format must be 'html' or 'edits'")
     annotated_essay = await get_annotated_fixed_essay(answer)
     return annotated_essay
 
@@ -105,7 +200,7 @@ async def get_annotated_fixed_essay_endpoint(answer: str):
 async def process_essay_endpoint(request: Feedback):
     """
     Combined endpoint to run feedback, statistics, and annotation in one session.
-    Stores all three results under a shared session_id.
+    Stores all three results in a single session document.
     """
     session_id = str(uuid.uuid4())
     now = datetime.utcnow()
@@ -113,39 +208,25 @@ async def process_essay_endpoint(request: Feedback):
     answer   = request.answer
 
     # Run services
-    feedback_task  = get_feedback(question, answer)
-    stats_task     = get_essay_statistics(answer)
-    annotated_task = get_annotated_fixed_essay(answer)
+    feedback_task  = get_feedback(question, answer, app.state.clients)
+    stats_task     = get_essay_statistics(answer, app.state.clients.gemini_pool)
+    edits_task     = get_essay_edits(answer)
 
     # 2. Chạy đồng thời, chờ cả 3 xong
-    feedback, stats, annotated = await asyncio.gather(
+    feedback, stats, grammar_edits = await asyncio.gather(
         feedback_task,
         stats_task,
-        annotated_task
+        edits_task
     )
+    with stage_timer("coedit_render"):
+        annotated = render_edits_html(grammar_edits["text"], grammar_edits["edits"])
     # print("Annotated essay:", annotated)
-    # Persist to MongoDB with shared session_id
-    feedback_col.insert_one({
-        "session_id": session_id,
-        "question":    question,
-        "answer":      answer,
-        "response":    feedback,
-        "created_at":  now
-    })
-    stats_col.insert_one({
-        "session_id": session_id,
-        "question":    question,
-        "answer":     answer,
-        "statistics": stats,
-        "created_at": now
-    })
-    annotation_col.insert_one({
-        "session_id":      session_id,
-        "question":        question,
-        "answer":           answer,
-        "annotated_essay":  annotated,
-        "created_at":       now
-    })
+    # Persist to MongoDB: one document, one write
+    await app.state.session_writer.insert(
+        SESSIONS_COLLECTION,
+        # The compact edit list is stored; the HTML is re-rendered from it on read
+        session_document(session_id, question, answer, feedback, stats, grammar_edits["edits"], now),
+    )
 
     # Return combined results
     return {
@@ -166,32 +247,62 @@ async def process_essay_endpoint(request: Feedback):
 #     session_ids = [doc["session_id"] for doc in docs]
 #     return {"session_ids": session_ids}
 @app.get("/sessions")
-async def list_sessions():
-    docs = list(
-        feedback_col
-        .find({}, {"session_id":1, "question":1, "created_at":1})
-        .sort("created_at", -1)
-    )
-    return {"sessions": [{"session_id": d["session_id"], "question": d["question"]} for d in docs]}
+async def list_sessions(
+    limit: int = SESSIONS_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    question: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+):
+    """
+    Newest sessions first, one page at a time. Pass the returned next_cursor as
+    `cursor` to get the following page; it is null on the last page.
+    """
+    if not 1 <= limit <= SESSIONS_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=422, detail=f"limit must be between 1 and {SESSIONS_MAX_PAGE_SIZE}")
+    try:
+        docs, next_cursor = await list_sessions_page(
+            app.state.db, limit, cursor, question, created_after, created_before
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {
+        "sessions": [
+            {"session_id": d["session_id"], "question": d["question"], "created_at": d["created_at"]}
+            for d in docs
+        ],
+        "next_cursor": next_cursor,
+    }
+
+def annotated_essay_html(session_doc: dict) -> str:
+    # Older sessions stored the rendered HTML, newer ones only the edit list
+    if "annotated_essay" in session_doc:
+        return session_doc["annotated_essay"]
+    return render_edits_html(session_doc["answer"].strip(), session_doc["edits"])
 
 @app.get("/session/{session_id}")
 async def get_session(session_id: str):
-    feedback_doc = feedback_col.find_one({"session_id": session_id})
-    stats_doc    = stats_col.find_one({"session_id": session_id})
-    anno_doc     = annotation_col.find_one({"session_id": session_id})
-
-    if not (feedback_doc and stats_doc and anno_doc):
+    session_doc = await find_session(app.state.db, session_id)
+    if session_doc is None:
         raise HTTPException(status_code=404, detail="Session not found")
 
     return {
         "session_id":      session_id,
-        "question":        feedback_doc["question"],
-        "answer":          feedback_doc["answer"],
-        "feedback":        feedback_doc["response"],
-        "statistics":      stats_doc["statistics"],
-        "annotated_essay": anno_doc["annotated_essay"],
-        "created_at":      feedback_doc["created_at"],
+        "question":        session_doc["question"],
+        "answer":          session_doc["answer"],
+        "feedback":        session_doc["feedback"],
+        "statistics":      session_doc["statistics"],
+        "annotated_essay": annotated_essay_html(session_doc),
+        "created_at":      session_doc["created_at"],
     }
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 503 until every model is loaded and warmed up, with a per-model
+    breakdown of the startup phases.
+    """
+    return JSONResponse(startup_status.report(), status_code=200 if startup_status.ready else 503)
+
 @app.get("/metrics")
 def metrics():
     return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,282 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+
+
+def _get_or_create(metric_cls, name, documentation, labelnames=(), **kwargs):
+    try:
+        return metric_cls(name, documentation, labelnames, **kwargs)
+    except ValueError:
+        # Metrics already registered (probably due to hot reload)
+        return REGISTRY._names_to_collectors.get(name)
+
+
+# Essay pipeline stages (BERT, CoEdIT, Ollama, Gemini, MongoDB writes)
+STAGE_SECONDS = _get_or_create(
+    Histogram, "pipeline_stage_seconds",
+    "Latency of each essay pipeline stage",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160)
+)
+STAGE_IN_FLIGHT = _get_or_create(
+    Gauge, "pipeline_stage_in_flight",
+    "Pipeline stage executions currently running",
+    ["stage"]
+)
+HTTP_IN_FLIGHT = _get_or_create(
+    Gauge, "http_requests_in_flight",
+    "HTTP requests currently being handled, by route template",
+    ["method", "endpoint"]
+)
+LLM_TOKENS = _get_or_create(
+    Counter, "llm_tokens_total",
+    "Prompt and completion tokens per LLM model",
+    ["model", "kind"]
+)
+EXECUTOR_PENDING = _get_or_create(
+    Gauge, "inference_executor_pending",
+    "Jobs submitted to an inference executor and not finished yet (queued + running)",
+    ["executor"]
+)
+EXECUTOR_WORKERS = _get_or_create(
+    Gauge, "inference_executor_workers",
+    "Worker threads or processes of an inference executor",
+    ["executor"]
+)
+BATCHER_QUEUE = _get_or_create(
+    Gauge, "micro_batcher_queue_depth",
+    "Items waiting in a micro-batcher for the next batch",
+    ["batcher"]
+)
+
+# Caches (score cache, grammar correction cache, LLM response cache, ...)
+CACHE_HITS = _get_or_create(
+    Counter, "cache_hits_total",
+    "Cache hits by cache and tier",
+    ["cache", "tier"]
+)
+CACHE_MISSES = _get_or_create(
+    Counter, "cache_misses_total",
+    "Lookups that missed every tier of a cache",
+    ["cache"]
+)
+CACHE_ENTRIES = _get_or_create(
+    Gauge, "cache_entries",
+    "Entries currently held in a cache's in-memory tier",
+    ["cache"]
+)
+CACHE_BYTES = _get_or_create(
+    Gauge, "cache_bytes",
+    "Approximate size in bytes of a cache's in-memory tier",
+    ["cache"]
+)
+SINGLE_FLIGHT_COALESCED = _get_or_create(
+    Counter, "single_flight_coalesced_total",
+    "Calls that joined an identical in-flight computation instead of starting their own",
+    ["operation"]
+)
+
+# CoEdIT grammar correction, per chunk
+COEDIT_CHUNKS = _get_or_create(
+    Counter, "coedit_chunks_total",
+    "Grammar chunks by outcome (cached, unchanged, changed, early_exit)",
+    ["profile", "outcome"]
+)
+COEDIT_CHUNK_SECONDS = _get_or_create(
+    Histogram, "coedit_chunk_generate_seconds",
+    "Share of generate() time per corrected chunk (batch latency divided by its rows)",
+    ["profile"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+)
+COEDIT_BATCH_SECONDS = _get_or_create(
+    Histogram, "coedit_batch_generate_seconds",
+    "Latency of each batched CoEdIT generate() call",
+    ["profile"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+)
+COEDIT_CHUNK_TOKENS = _get_or_create(
+    Histogram, "coedit_chunk_tokens",
+    "Input and output token counts per generated chunk",
+    ["profile", "direction"],
+    buckets=(4, 8, 16, 24, 32, 48, 64, 96, 128)
+)
+
+# Gemini band descriptor handles
+DESCRIPTOR_UPLOADS = _get_or_create(
+    Counter, "band_descriptor_uploads_total",
+    "Band descriptor uploads to the Gemini API, by kind (file, context_cache)",
+    ["kind"]
+)
+
+# Connection pools of the long-lived HTTP clients (Ollama, one per Gemini key)
+HTTP_POOL_CONNECTIONS = _get_or_create(
+    Gauge, "http_client_pool_connections",
+    "Connections of an HTTP client pool in use by a request, by state (active)",
+    ["client", "state"]
+)
+HTTP_POOL_WAITING = _get_or_create(
+    Gauge, "http_client_pool_waiting_requests",
+    "Requests in flight beyond an HTTP client pool's max connections, i.e. waiting for a free one",
+    ["client"]
+)
+
+# Ollama streaming
+OLLAMA_TTFT = _get_or_create(
+    Histogram, "ollama_time_to_first_token_seconds",
+    "Time from sending an Ollama chat request to its first streamed token",
+    ["model"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+)
+OLLAMA_TOKENS_PER_SECOND = _get_or_create(
+    Histogram, "ollama_tokens_per_second",
+    "Ollama generation speed per call",
+    ["model"],
+    buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200)
+)
+OLLAMA_STREAM_STOPS = _get_or_create(
+    Counter, "ollama_stream_stops_total",
+    "How Ollama streams ended: json_complete (closed early) or done",
+    ["model", "reason"]
+)
+
+# LLM dispatch (Gemini key pool, Ollama)
+LLM_CALLS = _get_or_create(
+    Counter, "llm_calls_total",
+    "LLM calls by backend, key slot, operation and outcome (success, rate_limited, error, rejected, circuit_open)",
+    ["backend", "key", "operation", "outcome"]
+)
+LLM_HEDGES = _get_or_create(
+    Counter, "llm_hedged_requests_total",
+    "Hedged duplicate Gemini calls that were sent, and those that returned first",
+    ["operation", "outcome"]
+)
+LLM_CIRCUIT_STATE = _get_or_create(
+    Gauge, "llm_circuit_state",
+    "Circuit breaker state per backend or key (0 closed, 1 half open, 2 open)",
+    ["backend"]
+)
+LLM_IN_FLIGHT = _get_or_create(
+    Gauge, "llm_key_in_flight",
+    "Gemini calls currently running on each key slot",
+    ["key"]
+)
+
+# LLM JSON output
+JSON_PARSES = _get_or_create(
+    Counter, "llm_json_parses_total",
+    "Parses of LLM JSON output by outcome (clean, local_fixed, llm_fixed, failed)",
+    ["source", "outcome"]
+)
+
+# BERT input padding (real vs. padding tokens in the forward passes)
+BERT_TOKENS = _get_or_create(
+    Counter, "bert_input_tokens_total",
+    "Tokens fed to BERT forward passes, by kind (real, padding)",
+    ["kind"]
+)
+
+# MongoDB write-behind queue
+MONGO_WRITE_QUEUE = _get_or_create(
+    Gauge, "mongo_write_queue_depth",
+    "Documents waiting in the MongoDB write-behind queue"
+)
+MONGO_WRITES = _get_or_create(
+    Counter, "mongo_write_behind_documents_total",
+    "Write-behind documents by collection and outcome (written, failed attempt, dropped)",
+    ["collection", "outcome"]
+)
+MONGO_FLUSH_SECONDS = _get_or_create(
+    Histogram, "mongo_write_flush_seconds",
+    "Duration of each write-behind insert_many",
+    ["collection"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+MONGO_FLUSH_BATCH = _get_or_create(
+    Histogram, "mongo_write_flush_batch_size",
+    "Documents per write-behind insert_many",
+    ["collection"],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+MONGO_WRITE_DELAY = _get_or_create(
+    Histogram, "mongo_write_durability_seconds",
+    "Time from queueing a document until it is written to MongoDB",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+
+
+def observe_coedit_chunks(profile: str, chunk_stats: list):
+    for stats in chunk_stats:
+        if stats.get("cached"):
+            COEDIT_CHUNKS.labels(profile, "cached").inc()
+            continue
+        COEDIT_CHUNKS.labels(profile, "unchanged" if stats["unchanged"] else "changed").inc()
+        if stats["early_exit"]:
+            COEDIT_CHUNKS.labels(profile, "early_exit").inc()
+        COEDIT_CHUNK_SECONDS.labels(profile).observe(stats["seconds"])
+        if stats.get("batch_row") == 0:
+            # Once per generate() call: row 0 belongs to exactly one document
+            COEDIT_BATCH_SECONDS.labels(profile).observe(stats["batch_seconds"])
+        COEDIT_CHUNK_TOKENS.labels(profile, "input").observe(stats["input_tokens"])
+        COEDIT_CHUNK_TOKENS.labels(profile, "output").observe(stats["output_tokens"])
+
+
+def track_lru_cache(name: str, cache):
+    """
+    Export the size of an LRUCache's in-memory tier under the given cache label.
+    """
+    CACHE_ENTRIES.labels(name).set_function(lambda: len(cache))
+    CACHE_BYTES.labels(name).set_function(lambda: cache.current_bytes)
+
+
+def track_http_pool(name: str, transport):
+    """
+    Export the pool usage of an httpx client under the given client label, from the
+    requests its InFlightTransport (clients.py) is handling.
+    """
+    HTTP_POOL_CONNECTIONS.labels(name, "active").set_function(
+        lambda: min(transport.in_flight, transport.max_connections))
+    HTTP_POOL_WAITING.labels(name).set_function(
+        lambda: max(transport.in_flight - transport.max_connections, 0))
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """
+    Time a pipeline stage into pipeline_stage_seconds and count it as in flight meanwhile.
+    Usable around blocking code and around awaits.
+    """
+    STAGE_IN_FLIGHT.labels(stage).inc()
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start_time)
+        STAGE_IN_FLIGHT.labels(stage).dec()
+
+
+def observe_bert_tokens(real_tokens: int, padding_tokens: int):
+    BERT_TOKENS.labels("real").inc(real_tokens)
+    BERT_TOKENS.labels("padding").inc(padding_tokens)
+
+
+def count_llm_tokens(model: str, prompt_tokens, completion_tokens):
+    if prompt_tokens:
+        LLM_TOKENS.labels(model, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(model, "completion").inc(completion_tokens)
+
+
+def count_gemini_tokens(model: str, response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        count_llm_tokens(model, usage.prompt_token_count, usage.candidates_token_count)
+
+
+def track_executor(executor):
+    EXECUTOR_PENDING.labels(executor.name).set_function(lambda: executor.pending)
+    EXECUTOR_WORKERS.labels(executor.name).set(executor.workers)
+
+
+def track_batcher(name: str, batcher):
+    BATCHER_QUEUE.labels(name).set_function(lambda: batcher.pending)
@@ -0,0 +1,76 @@
+import asyncio
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent callers and hands them to `process_batch`
+    as one list, either when `max_batch_size` items are pending or when the oldest
+    pending item has waited `window_ms` milliseconds, whichever comes first.
+
+    `process_batch` is a blocking function (e.g. a model forward pass) that receives a
+    list of items and returns a list of results in the same order. It runs on
+    `executor` (an InferenceExecutor, or the default thread pool when None) so the
+    event loop is never blocked.
+    """
+
+    def __init__(self, process_batch, max_batch_size: int = 16, window_ms: float = 10.0, executor=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.window = max(window_ms, 0.0) / 1000.0
+        self.executor = executor
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    @property
+    def pending(self) -> int:
+        """
+        Items waiting for the next batch.
+        """
+        return len(self._pending)
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        # submit() flushes as soon as max_batch_size is reached, so this never exceeds it
+        batch, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            if self.executor is None:
+                results = await asyncio.to_thread(self.process_batch, items)
+            else:
+                results = await self.executor.run(self.process_batch, items)
+            if len(results) != len(items):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,95 @@
+"""
+Move sessions from the legacy feedback/statistics/annotations collections into the
+single-document "sessions" collection.
+
+Usage:
+    python migrate_sessions.py [--batch-size 500] [--dry-run] [--restart]
+
+Legacy feedback documents are read in _id order, in batches. For each batch the
+matching statistics and annotation documents are fetched, the session documents are
+inserted into "sessions" (an existing session document is never overwritten), and
+only then are the three legacy documents of those sessions deleted. Each session is
+therefore in exactly one layout, and the API reads both while the migration runs.
+
+Progress is checkpointed in the "migrations" collection after every batch, so an
+interrupted run resumes where it stopped; re-running a half-finished batch is safe.
+Sessions missing their statistics or annotation document are left in place and
+counted as incomplete. Back up the database before the first run.
+"""
+import argparse
+from datetime import datetime
+
+from pymongo import MongoClient, UpdateOne
+from pymongo.server_api import ServerApi
+
+from database import DB_NAME, LEGACY_COLLECTIONS, MONGO_URI, SESSIONS_COLLECTION, session_from_legacy
+
+MIGRATION_ID = "sessions_single_document"
+
+
+def migrate_batch(db, feedback_docs: list, dry_run: bool):
+    session_ids = [doc["session_id"] for doc in feedback_docs]
+    stats_docs = {doc["session_id"]: doc for doc in db["statistics"].find({"session_id": {"$in": session_ids}})}
+    anno_docs = {doc["session_id"]: doc for doc in db["annotations"].find({"session_id": {"$in": session_ids}})}
+
+    sessions = [
+        session_from_legacy(doc, stats_docs[doc["session_id"]], anno_docs[doc["session_id"]])
+        for doc in feedback_docs
+        if doc["session_id"] in stats_docs and doc["session_id"] in anno_docs
+    ]
+    if sessions and not dry_run:
+        db[SESSIONS_COLLECTION].bulk_write(
+            [UpdateOne({"session_id": s["session_id"]}, {"$setOnInsert": s}, upsert=True) for s in sessions],
+            ordered=False,
+        )
+        migrated_ids = [s["session_id"] for s in sessions]
+        for name in LEGACY_COLLECTIONS:
+            db[name].delete_many({"session_id": {"$in": migrated_ids}})
+    return len(sessions), len(feedback_docs) - len(sessions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default=MONGO_URI)
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Count what would be migrated without writing")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and scan from the beginning")
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri, server_api=ServerApi('1'))
+    db = client[args.db]
+    db[SESSIONS_COLLECTION].create_index("session_id", unique=True)
+    checkpoints = db["migrations"]
+
+    checkpoint = None if args.restart else checkpoints.find_one({"_id": MIGRATION_ID})
+    last_id = checkpoint["last_id"] if checkpoint else None
+    migrated = checkpoint["migrated"] if checkpoint else 0
+    incomplete = checkpoint["incomplete"] if checkpoint else 0
+    if last_id is not None:
+        print(f"Resuming after {last_id} ({migrated} migrated, {incomplete} incomplete so far)")
+
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = list(db["feedback"].find(query).sort("_id", 1).limit(args.batch_size))
+        if not batch:
+            break
+
+        batch_migrated, batch_incomplete = migrate_batch(db, batch, args.dry_run)
+        migrated += batch_migrated
+        incomplete += batch_incomplete
+        last_id = batch[-1]["_id"]
+        if not args.dry_run:
+            checkpoints.replace_one(
+                {"_id": MIGRATION_ID},
+                {"last_id": last_id, "migrated": migrated, "incomplete": incomplete, "updated_at": datetime.utcnow()},
+                upsert=True,
+            )
+        print(f"{migrated} migrated, {incomplete} incomplete (last _id {last_id})")
+
+    print(f"Done{' (dry run)' if args.dry_run else ''}: {migrated} sessions migrated, {incomplete} incomplete left in the legacy collections")
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Pinned local copies of the model repos live in MODEL_DIR/<repo_id> (see download_models.py).
+# With MODELS_OFFLINE=true nothing is fetched from the Hugging Face Hub; artifacts come from
+# MODEL_DIR or, failing that, from the local Hugging Face cache.
+MODEL_DIR = os.getenv("MODEL_DIR", "models")
+MODELS_OFFLINE = os.getenv("MODELS_OFFLINE", "false").lower() == "true" or os.getenv("HF_HUB_OFFLINE") == "1"
+HF_TOKEN = os.getenv("IELTS_HUGGINGFACE_API_KEY") or None
+# "startup": load and warm up every model in the background as soon as the app starts
+# "lazy": load each model on its first request
+MODEL_LOADING = os.getenv("MODEL_LOADING", "startup")
+# Seconds the startup warmup may take before /ready reports "over_budget" (0 disables the budget)
+MODEL_STARTUP_BUDGET_SECONDS = float(os.getenv("MODEL_STARTUP_BUDGET_SECONDS", "0"))
+
+BERT_REPO_ID = "nghes/IELTS-BertwitthhExtraFeature"
+COEDIT_REPO_ID = "grammarly/coedit-large"
+MODEL_REVISIONS = {
+    BERT_REPO_ID: os.getenv("BERT_MODEL_REVISION", "main"),
+    COEDIT_REPO_ID: os.getenv("COEDIT_MODEL_REVISION", "main"),
+}
+
+
+def local_repo_dir(repo_id: str) -> str:
+    return os.path.join(MODEL_DIR, repo_id)
+
+
+def resolve_repo(repo_id: str) -> str:
+    """
+    Argument for from_pretrained(): the pinned local directory when it exists, else the Hub repo id.
+    """
+    local_dir = local_repo_dir(repo_id)
+    return local_dir if os.path.isdir(local_dir) else repo_id
+
+
+def pretrained_kwargs(repo_id: str) -> dict:
+    if os.path.isdir(local_repo_dir(repo_id)):
+        return {"local_files_only": True}
+    return {"revision": MODEL_REVISIONS.get(repo_id, "main"), "token": HF_TOKEN, "local_files_only": MODELS_OFFLINE}
+
+
+def resolve_artifact(repo_id: str, filename: str) -> str:
+    """
+    Path to a single file of a model repo, preferring the pinned local directory.
+    """
+    local_path = os.path.join(local_repo_dir(repo_id), filename)
+    if os.path.exists(local_path):
+        return local_path
+
+    from huggingface_hub import hf_hub_download
+    return hf_hub_download(
+        repo_id=repo_id,
+        filename=filename,
+        revision=MODEL_REVISIONS.get(repo_id, "main"),
+        token=HF_TOKEN,
+        local_files_only=MODELS_OFFLINE,
+    )
+
+
+@contextmanager
+def timed_phase(phases: dict, name: str):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = round(time.perf_counter() - start_time, 3)
+
+
+class LazyModel:
+    """
+    Loads a model the first time get() is called, exactly once even under concurrent
+    callers. `loader(phases)` returns the loaded object and may record sub-phase
+    timings into `phases`.
+    """
+
+    def __init__(self, name: str, loader):
+        self.name = name
+        self.loader = loader
+        self.phases = {}
+        self._value = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not None
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    phases = {}
+                    with timed_phase(phases, "total_load"):
+                        value = self.loader(phases)
+                    self.phases = phases
+                    self._value = value
+                    print(f"{self.name} loaded in {phases['total_load']:.2f}s {phases}")
+        return self._value
+
+
+class StartupStatus:
+    """
+    Readiness state of the API process: which models finished their warmup, the
+    per-model phase timings, and whether the startup budget was exceeded.
+    """
+
+    def __init__(self, budget_seconds: float = MODEL_STARTUP_BUDGET_SECONDS):
+        self.budget_seconds = budget_seconds
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self.models = {}
+        self.errors = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None and not self.errors
+
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return round(end - self.started_at, 3)
+
+    def report(self) -> dict:
+        over_budget = bool(self.budget_seconds) and self.elapsed() > self.budget_seconds
+        if self.ready:
+            status = "ready"
+        elif self.errors:
+            status = "failed"
+        elif over_budget:
+            status = "over_budget"
+        else:
+            status = "loading"
+        return {
+            "status": status,
+            "elapsed_seconds": self.elapsed(),
+            "budget_seconds": self.budget_seconds or None,
+            "models": self.models,
+            "errors": self.errors,
+        }
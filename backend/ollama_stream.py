@@ -0,0 +1,117 @@
+import json
+import time
+
+import httpx
+
+from metrics import OLLAMA_STREAM_STOPS, OLLAMA_TOKENS_PER_SECOND, OLLAMA_TTFT, count_llm_tokens
+
+
+class JsonObjectTracker:
+    """
+    Follows streamed text character by character and reports when the first top-level
+    JSON object is closed. Braces inside strings (including escaped quotes) are ignored.
+    Text before the first "{" (e.g. a ```json fence) is skipped.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+        self.complete = False
+
+    def feed(self, text: str) -> bool:
+        """
+        Consume the next piece of text; returns True once the top-level object is balanced.
+        """
+        for char in text:
+            if self.complete:
+                break
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                if self.started:
+                    self.in_string = True
+            elif char in "{[":
+                if char == "{" or self.started:
+                    self.started = True
+                    self.depth += 1
+            elif char in "}]" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.complete = True
+        return self.complete
+
+
+async def stream_ollama_chat(http_client: httpx.AsyncClient, url: str, payload: dict, stop_at_json: bool = True):
+    """
+    POST a streaming chat request to Ollama and assemble the reply from the NDJSON lines
+    as they arrive. With stop_at_json=True the stream is closed as soon as a balanced
+    top-level JSON object has been received, which makes Ollama stop generating.
+
+    Returns (text, stats) where stats has ttft_seconds, seconds, tokens, tokens_per_second
+    and stopped_early.
+    """
+    model = payload.get("model", "")
+    tracker = JsonObjectTracker()
+    pieces = []
+    tokens = 0
+    first_token_at = None
+    stopped_early = False
+    final = {}
+    start_time = time.perf_counter()
+
+    async with http_client.stream("POST", url, json={**payload, "stream": True}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if data.get("error"):
+                raise httpx.HTTPError(f"Ollama error: {data['error']}")
+
+            content = data.get("message", {}).get("content", "")
+            if content:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                tokens += 1
+                pieces.append(content)
+                if stop_at_json and tracker.feed(content):
+                    # Leaving the context closes the connection, and Ollama aborts the generation
+                    stopped_early = not data.get("done", False)
+                    break
+            if data.get("done"):
+                final = data
+                break
+
+    end_time = time.perf_counter()
+    # Ollama's own counters are exact when the stream ran to the end
+    if final.get("eval_count") and final.get("eval_duration"):
+        tokens = final["eval_count"]
+        tokens_per_second = final["eval_count"] / (final["eval_duration"] / 1e9)
+    else:
+        generation_time = end_time - (first_token_at or start_time)
+        tokens_per_second = tokens / generation_time if generation_time > 0 else 0.0
+
+    stats = {
+        "ttft_seconds": round((first_token_at or end_time) - start_time, 4),
+        "seconds": round(end_time - start_time, 4),
+        "tokens": tokens,
+        "tokens_per_second": round(tokens_per_second, 2),
+        "stopped_early": stopped_early,
+    }
+    if first_token_at is not None:
+        OLLAMA_TTFT.labels(model).observe(stats["ttft_seconds"])
+        OLLAMA_TOKENS_PER_SECOND.labels(model).observe(stats["tokens_per_second"])
+    OLLAMA_STREAM_STOPS.labels(model, "json_complete" if stopped_early else "done").inc()
+    # The prompt token count only arrives in the final line, so it is missing for streams closed early
+    count_llm_tokens(model, final.get("prompt_eval_count"), tokens)
+    return "".join(pieces), stats
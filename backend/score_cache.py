@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+from dotenv import load_dotenv
+
+from lru_cache import LRUCache
+from metrics import CACHE_HITS, CACHE_MISSES, track_lru_cache
+
+load_dotenv()
+
+SCORE_CACHE_MAX_ENTRIES = int(os.getenv("SCORE_CACHE_MAX_ENTRIES", "20000"))
+SCORE_CACHE_MAX_BYTES = int(os.getenv("SCORE_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+# Also keep scores in the "score_cache" MongoDB collection so they survive restarts
+SCORE_CACHE_PERSIST = os.getenv("SCORE_CACHE_PERSIST", "false").lower() == "true"
+# Persisted scores expire after this long (MongoDB TTL index), so keys of retired models do not pile up
+SCORE_CACHE_TTL_SECONDS = int(os.getenv("SCORE_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+# Bump to invalidate cached scores after replacing the weights without changing BERT_MODEL_REVISION
+SCORE_CACHE_VERSION = os.getenv("SCORE_CACHE_VERSION", "1")
+
+
+def normalize_text(text: str) -> str:
+    # bert-base-uncased lowercases its input and splits on whitespace, and the word-count
+    # feature only depends on whitespace splitting, so these normalizations do not change
+    # the model's output. Unicode normalization (NFKC) would: it folds full-width
+    # characters, ligatures and circled digits that the tokenizer keeps apart.
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def essay_cache_key(question: str, answer: str, model_version: str) -> str:
+    """
+    Cache key of an essay for one scorer. `model_version` names the weights and the
+    inference backend, whose raw outputs differ slightly, so switching either one
+    never serves scores computed by the other.
+    """
+    normalized = "\x1f".join((SCORE_CACHE_VERSION, model_version, normalize_text(question), normalize_text(answer)))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class ScoreCache:
+    """
+    Two-tier cache of BERT results keyed by essay_cache_key.
+
+    Each entry stores the final rounded score and the pooled BERT output. The
+    in-memory tier is an LRUCache bounded by entry count and bytes. The optional
+    persistent tier is an async (Motor) MongoDB collection, attached at startup.
+    It is best effort: its errors are logged and count as misses, and writes to it
+    run in the background instead of on the response path.
+    """
+
+    def __init__(self, max_entries: int = SCORE_CACHE_MAX_ENTRIES, max_bytes: int = SCORE_CACHE_MAX_BYTES):
+        self.memory = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self.collection = None
+        # References to the background writes, so they are not garbage collected mid-flight
+        self._writes = set()
+        track_lru_cache("score", self.memory)
+
+    async def attach_collection(self, collection, ttl_seconds: int = SCORE_CACHE_TTL_SECONDS):
+        await collection.create_index("created_at", expireAfterSeconds=ttl_seconds)
+        self.collection = collection
+
+    async def get(self, key: str):
+        entry = self.memory.get(key)
+        if entry is not None:
+            CACHE_HITS.labels("score", "memory").inc()
+            return entry
+
+        if self.collection is not None:
+            try:
+                doc = await self.collection.find_one({"_id": key})
+            except Exception as e:
+                print(f"Score cache read failed, scoring without it: {e!r}")
+                doc = None
+            if doc is not None:
+                entry = {
+                    "score": doc["score"],
+                    "pooled": np.frombuffer(doc["pooled"], dtype=np.float32) if doc.get("pooled") else None,
+                }
+                self.memory.put(key, entry)
+                CACHE_HITS.labels("score", "mongo").inc()
+                return entry
+
+        CACHE_MISSES.labels("score").inc()
+        return None
+
+    async def put(self, key: str, score: float, pooled=None):
+        pooled = np.asarray(pooled, dtype=np.float32) if pooled is not None else None
+        self.memory.put(key, {"score": score, "pooled": pooled})
+
+        if self.collection is not None:
+            doc = {
+                "score": score,
+                "pooled": pooled.tobytes() if pooled is not None else None,
+                "created_at": datetime.utcnow(),
+            }
+            task = asyncio.create_task(self._persist(key, doc))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    async def _persist(self, key: str, doc: dict):
+        try:
+            await self.collection.replace_one({"_id": key}, doc, upsert=True)
+        except Exception as e:
+            print(f"Score cache write failed: {e!r}")
+
+
+score_cache = ScoreCache()
@@ -0,0 +1,149 @@
+import asyncio
+import time
+from collections import defaultdict
+
+from pymongo.errors import BulkWriteError
+
+from metrics import MONGO_FLUSH_BATCH, MONGO_FLUSH_SECONDS, MONGO_WRITE_DELAY, MONGO_WRITE_QUEUE, MONGO_WRITES
+
+DUPLICATE_KEY = 11000
+
+
+class WriteBehindQueue:
+    """
+    Bounded queue of MongoDB inserts, flushed in the background with insert_many.
+
+    enqueue() returns once the document is queued, so request handlers do not wait for
+    MongoDB round trips. When the queue is full, enqueue() waits for space (backpressure).
+    The flusher takes up to `batch_size` documents, or whatever arrived within
+    `flush_interval_ms` of the first one, and writes them with one unordered
+    insert_many per collection. Documents that failed are retried `max_attempts` times
+    with backoff, and then dropped and counted. close() flushes what is still queued,
+    within a timeout.
+
+    `db` is anything that maps a collection name to an object with an async
+    insert_many(docs, ordered=False), e.g. a Motor database or an in-memory stand-in.
+    """
+
+    def __init__(self, db, max_size: int = 10000, batch_size: int = 100, flush_interval_ms: float = 50.0,
+                 max_attempts: int = 5):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_attempts = max_attempts
+        self.queue = asyncio.Queue(maxsize=max_size)
+        self._task = None
+        MONGO_WRITE_QUEUE.set_function(self.queue.qsize)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def enqueue(self, collection: str, doc: dict):
+        await self.queue.put((collection, doc, time.perf_counter()))
+
+    async def _next_batch(self, batch: list):
+        # Fills `batch` in place, so documents already taken off the queue are still
+        # accounted for if close() cancels the flusher while it waits for more
+        batch.append(await self.queue.get())
+        deadline = time.perf_counter() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+    async def _write(self, batch: list):
+        by_collection = defaultdict(list)
+        for collection, doc, enqueued_at in batch:
+            by_collection[collection].append((doc, enqueued_at))
+
+        for collection, entries in by_collection.items():
+            for attempt in range(1, self.max_attempts + 1):
+                docs = [doc for doc, _ in entries]
+                start_time = time.perf_counter()
+                try:
+                    await self.db[collection].insert_many(docs, ordered=False)
+                    failed = []
+                except BulkWriteError as e:
+                    # Unordered: everything but the reported documents was written. A duplicate
+                    # key means an earlier attempt already wrote it, so only retry the others.
+                    failed = [error["index"] for error in e.details.get("writeErrors", [])
+                              if error.get("code") != DUPLICATE_KEY]
+                    error_message = e
+                except Exception as e:
+                    failed = list(range(len(entries)))
+                    error_message = e
+                end_time = time.perf_counter()
+
+                failed_set = set(failed)
+                written = [entry for i, entry in enumerate(entries) if i not in failed_set]
+                if written:
+                    MONGO_FLUSH_SECONDS.labels(collection).observe(end_time - start_time)
+                    MONGO_FLUSH_BATCH.labels(collection).observe(len(written))
+                    MONGO_WRITES.labels(collection, "written").inc(len(written))
+                    for _, enqueued_at in written:
+                        # Time from enqueue() until the document is durable in MongoDB
+                        MONGO_WRITE_DELAY.observe(end_time - enqueued_at)
+                if not failed:
+                    break
+
+                entries = [entries[i] for i in failed]
+                MONGO_WRITES.labels(collection, "failed").inc(len(entries))
+                if attempt == self.max_attempts:
+                    MONGO_WRITES.labels(collection, "dropped").inc(len(entries))
+                    print(f"Dropping {len(entries)} {collection} documents after {attempt} attempts: {error_message}")
+                    break
+                await asyncio.sleep(min(0.1 * 2 ** attempt, 5))
+
+    async def _run(self):
+        while True:
+            batch = []
+            try:
+                await self._next_batch(batch)
+                await self._write(batch)
+            except asyncio.CancelledError:
+                # Stopped by close() while this batch was still being collected, written or retried
+                for collection, _, _ in batch:
+                    MONGO_WRITES.labels(collection, "dropped").inc()
+                raise
+            except Exception as e:
+                # Never let the flusher die: enqueue() would block forever once the queue fills
+                for collection, _, _ in batch:
+                    MONGO_WRITES.labels(collection, "dropped").inc()
+                print(f"Write-behind flush failed, dropping {len(batch)} documents: {e!r}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def flush(self):
+        """
+        Wait until every document queued so far has been written (or dropped).
+        """
+        await self.queue.join()
+
+    async def close(self, timeout: float = 30.0):
+        """
+        Flush the queue for at most `timeout` seconds, then stop the flusher. Documents
+        still queued (or in a batch being collected or retried) after that are counted as dropped.
+        """
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            left = self.queue.qsize()
+            while not self.queue.empty():
+                collection, _, _ = self.queue.get_nowait()
+                MONGO_WRITES.labels(collection, "dropped").inc()
+                self.queue.task_done()
+            print(f"Write-behind flush timed out after {timeout}s, dropping {left} queued documents")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
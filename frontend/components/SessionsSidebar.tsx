@@ -10,16 +10,29 @@ interface SessionItem {
 export default function SessionsSidebar() {
   const [sessions, setSessions] = useState<SessionItem[]>([])
   const [error, setError] = useState<string | null>(null)
+  // /sessions trả về từng trang; nextCursor = null khi đã hết
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [loading, setLoading] = useState(false)
 
-  useEffect(() => {
+  const loadPage = (cursor: string | null) => {
     const URL = process.env.NEXT_PUBLIC_API_URL
-    fetch(URL + "/sessions")
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : ""
+    setLoading(true)
+    fetch(URL + "/sessions" + query)
       .then((r) => {
         if (!r.ok) throw new Error(`Status ${r.status}`)
         return r.json()
       })
-      .then((json) => setSessions(json.sessions))
+      .then((json) => {
+        setSessions((prev) => (cursor ? [...prev, ...json.sessions] : json.sessions))
+        setNextCursor(json.next_cursor ?? null)
+      })
       .catch((e) => setError(e.message))
+      .finally(() => setLoading(false))
+  }
+
+  useEffect(() => {
+    loadPage(null)
   }, [])
 
   if (error) {
@@ -49,6 +62,17 @@ export default function SessionsSidebar() {
           </Link>
         )
       })}
+
+      {nextCursor && (
+        <button
+          type="button"
+          onClick={() => loadPage(nextCursor)}
+          disabled={loading}
+          className="block w-full px-3 py-2 rounded text-sm text-muted-foreground hover:bg-accent hover:text-accent-foreground disabled:opacity-50"
+        >
+          {loading ? "Loading…" : "Load more"}
+        </button>
+      )}
     </nav>
   )
 }